@@ -3,5 +3,11 @@ Agent module for emotion detection and intelligent state management.
 """
 
 from .state_agent import StateAgent
+from .results import EmotionResult
+from .trends import SessionBuffer
+from .batching import BatchedStateAgent
+from .rescoring import SentimentRescorer
+from .batch_rephrasing import BatchRephraser
 
-__all__ = ['StateAgent']
+__all__ = ['StateAgent', 'BatchedStateAgent', 'EmotionResult', 'SessionBuffer', 'SentimentRescorer',
+           'BatchRephraser']
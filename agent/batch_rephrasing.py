@@ -0,0 +1,118 @@
+"""
+Offline rephrasing of stored texts with OpenAI's Batch API, at half the
+price of synchronous calls, for jobs that can wait hours for results.
+"""
+
+import json
+import logging
+import os
+from typing import List, Optional
+
+from .state_agent import _REPHRASE_SYSTEM_PROMPT, _get_openai_client
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRephraser:
+    """
+    Runs rephrase_with_chatgpt's request over many texts as one OpenAI batch.
+
+    Each text becomes one line of the batch input, tagged with its position,
+    so results can be matched to the input order. Batches complete within
+    24 hours, so start() returns immediately and results() is called once
+    status() reports completed. The rephrased texts can then be scored with
+    SentimentRescorer.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-3.5-turbo"):
+        """
+        Initialize the rephraser.
+
+        Args:
+            api_key: OpenAI API key; defaults to the chatgptapi environment variable
+            model: Chat model the batch requests use
+        """
+        self.client = _get_openai_client(api_key or os.environ['chatgptapi'])
+        self.model = model
+
+    def start(self, texts: List[str]) -> str:
+        """
+        Upload texts and start a batch rephrasing them.
+
+        Args:
+            texts: Original user inputs
+
+        Returns:
+            OpenAI batch ID
+        """
+        lines = []
+        for index, text in enumerate(texts):
+            lines.append(json.dumps({
+                'custom_id': f"text-{index}",
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': self.model,
+                    'messages': [
+                        {'role': 'system', 'content': _REPHRASE_SYSTEM_PROMPT},
+                        {
+                            'role': 'user',
+                            'content': f"Enhance this text for better emotion analysis while keeping it authentic: {text}"
+                        }
+                    ],
+                    'max_tokens': 200,
+                    'temperature': 0.4
+                }
+            }))
+        input_file = self.client.files.create(
+            file=('rephrase_batch.jsonl', '\n'.join(lines).encode('utf-8')),
+            purpose='batch'
+        )
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h'
+        )
+        logger.info("Started rephrasing batch %s for %d texts", batch.id, len(texts))
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        """
+        Get a batch's status.
+
+        Args:
+            batch_id: Batch ID returned by start()
+
+        Returns:
+            OpenAI batch status, e.g. in_progress, completed, failed or expired
+        """
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str, count: int) -> List[Optional[str]]:
+        """
+        Download a completed batch's results.
+
+        Args:
+            batch_id: Batch ID returned by start()
+            count: Number of texts the batch was started with
+
+        Returns:
+            Rephrased text for each input text, in input order; None for
+            requests the batch failed on
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status != 'completed':
+            raise RuntimeError(f"Rephrasing batch {batch_id} is {batch.status}")
+
+        rephrased_texts: List[Optional[str]] = [None] * count
+        if batch.output_file_id is None:
+            return rephrased_texts
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            record = json.loads(line)
+            index = int(record['custom_id'].rsplit('-', 1)[1])
+            response = record.get('response') or {}
+            if response.get('status_code') == 200:
+                rephrased_texts[index] = response['body']['choices'][0]['message']['content'].strip()
+            else:
+                logger.error("Rephrasing failed for text %d: %s", index, record.get('error') or response.get('body'))
+        return rephrased_texts
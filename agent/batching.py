@@ -0,0 +1,115 @@
+"""
+Request coalescing for the State Agent.
+
+Concurrent single-text requests are gathered for a few milliseconds and
+processed together with StateAgent.process_text_batch, so Comprehend sees
+one batch call instead of one call per request.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from .state_agent import StateAgent
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedStateAgent:
+    """
+    Async front end that coalesces concurrent process_text calls into batches.
+
+    A batch is dispatched when it reaches max_batch_size texts or max_wait
+    seconds after its first text arrived, whichever comes first. Calls with
+    conversation history are not batchable and go straight to the agent.
+    """
+
+    def __init__(self, agent: StateAgent, max_batch_size: int = 25, max_wait: float = 0.02):
+        """
+        Initialize the batcher.
+
+        Args:
+            agent: State Agent that processes the batches
+            max_batch_size: Maximum texts per batch (Comprehend's batch limit is 25)
+            max_wait: Seconds to wait for more texts after the first one arrives
+        """
+        self.agent = agent
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+
+    async def aprocess_text(self, text: str, session_id: Optional[str] = None,
+                            context: Optional[str] = None,
+                            conversation_history: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """
+        Process a text, batched with other concurrent calls when possible.
+
+        Args:
+            text: Input text to analyze
+            session_id: Optional session identifier
+            context: Optional context for personalized responses
+            conversation_history: Previous conversation context for better responses
+
+        Returns:
+            Complete analysis results with emotion, sentiment, and response
+        """
+        if conversation_history:
+            return await self.agent.aprocess_text(text, session_id, context, conversation_history)
+
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._collector is None or self._collector.done():
+            self._collector = asyncio.get_running_loop().create_task(self._collect())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, session_id, future))
+        return await future
+
+    async def _collect(self) -> None:
+        """Gather queued texts into batches and dispatch each one as a task."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without awaiting so the next batch can start collecting
+            loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[Tuple[str, Optional[str], asyncio.Future]]) -> None:
+        """
+        Process one batch and resolve each caller's future.
+
+        Args:
+            batch: Queued (text, session_id, future) entries
+        """
+        try:
+            results = await asyncio.to_thread(
+                self.agent.process_text_batch,
+                [text for text, _, _ in batch],
+                session_ids=[session_id for _, session_id, _ in batch]
+            )
+        except Exception as e:
+            logger.error("Batched text processing failed: %s", e)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+        # A short result list must not leave the remaining callers waiting forever
+        if len(results) < len(batch):
+            error = RuntimeError(f"Batch returned {len(results)} results for {len(batch)} texts")
+            logger.error("Batched text processing failed: %s", error)
+            for _, _, future in batch[len(results):]:
+                if not future.done():
+                    future.set_exception(error)
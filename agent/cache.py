@@ -0,0 +1,350 @@
+"""
+In-memory caches used by the State Agent to avoid repeating
+Comprehend and ChatGPT round-trips for inputs it has already seen,
+exactly or as near-duplicates.
+"""
+
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with a fixed capacity.
+
+    The agent is shared across request threads, so every operation
+    takes a lock around the underlying OrderedDict.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries kept before evicting the oldest
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Look up a key, marking it as most recently used.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value or None on a miss
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store a value, evicting the least recently used entry when full.
+
+        Args:
+            key: Cache key
+            value: Value to store
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """
+        Remove a key if present.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Removed value or None if the key was not cached
+        """
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def save(self, path: str) -> None:
+        """
+        Write the cached entries to disk, least recently used first.
+
+        Args:
+            path: File to write; replaced if it exists
+        """
+        with self._lock:
+            items = list(self._data.items())
+        with open(path, 'wb') as f:
+            pickle.dump(items, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path: str) -> None:
+        """
+        Replace the cache contents with entries written by save().
+
+        Only the most recently used maxsize entries are kept if the file
+        holds more than fit.
+
+        Args:
+            path: File written by save()
+        """
+        with open(path, 'rb') as f:
+            items = pickle.load(f)
+        with self._lock:
+            self._data = OrderedDict(items[-self.maxsize:] if self.maxsize else ())
+
+    def clear(self) -> None:
+        """Remove all entries and reset the hit/miss counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SemanticCache:
+    """
+    Thread-safe cache keyed by embedding similarity instead of exact text.
+
+    Embeddings are L2-normalized and stored as rows of a preallocated
+    float32 matrix, so a lookup is one matrix-vector product over every
+    entry. When full, the least recently used row is overwritten.
+
+    With quantize=True rows are stored as int8 with a per-row scale, which
+    cuts the matrix to a quarter of its float32 size at a cosine error of
+    well under 0.01.
+    """
+
+    # Rows dequantized at a time when scoring an int8 matrix
+    _SCORE_BLOCK = 1024
+
+    def __init__(self, maxsize: int = 1024, threshold: float = 0.85, quantize: bool = False):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries kept before evicting the oldest
+            threshold: Minimum cosine similarity counted as a hit
+            quantize: Store embeddings as int8 instead of float32
+        """
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.quantize = quantize
+        self.hits = 0
+        self.misses = 0
+        self._matrix: Optional[np.ndarray] = None  # allocated on first put, once the dimension is known
+        self._scales = np.ones(maxsize, dtype=np.float32)
+        self._last_used = np.zeros(maxsize, dtype=np.int64)
+        self._values: List[Any] = []
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _allocate(self, dimension: int) -> None:
+        self._matrix = np.empty((self.maxsize, dimension), dtype=np.int8 if self.quantize else np.float32)
+
+    def _write_row(self, index: int, row: np.ndarray) -> None:
+        if self.quantize:
+            peak = float(np.abs(row).max())
+            scale = peak / 127 if peak else 1.0
+            self._matrix[index] = np.round(row / scale).astype(np.int8)
+            self._scales[index] = scale
+        else:
+            self._matrix[index] = row
+
+    def _read_rows(self, start: int, stop: int) -> np.ndarray:
+        if self.quantize:
+            return self._matrix[start:stop].astype(np.float32) * self._scales[start:stop, None]
+        return self._matrix[start:stop]
+
+    def _similarities(self, query: np.ndarray, size: int) -> np.ndarray:
+        if not self.quantize:
+            return self._matrix[:size] @ query
+        similarities = np.empty(size, dtype=np.float32)
+        for start in range(0, size, self._SCORE_BLOCK):
+            stop = min(start + self._SCORE_BLOCK, size)
+            similarities[start:stop] = (self._matrix[start:stop] @ query) * self._scales[start:stop]
+        return similarities
+
+    def get(self, embedding: np.ndarray) -> Optional[Any]:
+        """
+        Find the most similar cached entry.
+
+        Args:
+            embedding: Embedding of the input being looked up
+
+        Returns:
+            Cached value if its similarity reaches the threshold, else None
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            size = len(self._values)
+            if size:
+                similarities = self._similarities(query, size)
+                index = int(np.argmax(similarities))
+                if similarities[index] >= self.threshold:
+                    self._clock += 1
+                    self._last_used[index] = self._clock
+                    self.hits += 1
+                    return self._values[index]
+            self.misses += 1
+            return None
+
+    def put(self, embedding: np.ndarray, value: Any) -> None:
+        """
+        Store a value under an embedding, evicting the least recently used entry when full.
+
+        Args:
+            embedding: Embedding of the input
+            value: Value to store
+        """
+        row = self._normalize(embedding)
+        with self._lock:
+            self._insert(row, value)
+
+    def _insert(self, row: np.ndarray, value: Any) -> int:
+        """Store a normalized row in a free or evicted slot; the lock must be held."""
+        if self._matrix is None:
+            self._allocate(row.shape[0])
+        size = len(self._values)
+        if size < self.maxsize:
+            index = size
+            self._values.append(value)
+        else:
+            index = int(np.argmin(self._last_used))
+            self._values[index] = value
+        self._write_row(index, row)
+        self._clock += 1
+        self._last_used[index] = self._clock
+        return index
+
+    def save(self, path: str) -> None:
+        """
+        Write the cached embeddings and values to disk.
+
+        Args:
+            path: File to write; replaced if it exists
+        """
+        with self._lock:
+            size = len(self._values)
+            state = {
+                'embeddings': self._read_rows(0, size).copy() if size else None,
+                'last_used': self._last_used[:size].copy(),
+                'values': list(self._values),
+                'clock': self._clock,
+            }
+        with open(path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path: str) -> None:
+        """
+        Replace the cache contents with entries written by save().
+
+        Only the most recently used maxsize entries are kept if the file
+        holds more than fit.
+
+        Args:
+            path: File written by save()
+        """
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        embeddings = state['embeddings']
+        if embeddings is None:
+            return
+        keep = np.argsort(state['last_used'])[-self.maxsize:]
+        with self._lock:
+            self._allocate(embeddings.shape[1])
+            for index, row in enumerate(embeddings[keep]):
+                self._write_row(index, row)
+            self._last_used[:] = 0
+            self._last_used[:len(keep)] = state['last_used'][keep]
+            self._values = [state['values'][i] for i in keep]
+            self._clock = state['clock']
+
+    def clear(self) -> None:
+        """Remove all entries and reset the hit/miss counters."""
+        with self._lock:
+            self._values.clear()
+            self._last_used[:] = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class CentroidCache(SemanticCache):
+    """
+    Semantic cache that stores one entry per cluster of similar inputs.
+
+    A stored input within merge_threshold of an existing entry joins that
+    entry's cluster instead of taking a row of its own: the row becomes the
+    running mean of its members and keeps the value stored first. Lookups
+    still require threshold similarity to a cluster centroid.
+    """
+
+    def __init__(self, maxsize: int = 1024, threshold: float = 0.86, merge_threshold: float = 0.7,
+                 quantize: bool = False):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of clusters kept before evicting the oldest
+            threshold: Minimum cosine similarity to a centroid counted as a hit
+            merge_threshold: Minimum cosine similarity for a stored input to join a cluster
+            quantize: Store centroids as int8 instead of float32
+        """
+        super().__init__(maxsize=maxsize, threshold=threshold, quantize=quantize)
+        self.merge_threshold = merge_threshold
+        self._counts = np.zeros(maxsize, dtype=np.int64)
+
+    def put(self, embedding: np.ndarray, value: Any) -> None:
+        """
+        Add an input to its nearest cluster, or start a new cluster holding value.
+
+        Args:
+            embedding: Embedding of the input
+            value: Value returned for the cluster if a new one is created
+        """
+        row = self._normalize(embedding)
+        with self._lock:
+            size = len(self._values)
+            if size:
+                similarities = self._similarities(row, size)
+                index = int(np.argmax(similarities))
+                if similarities[index] >= self.merge_threshold:
+                    self._counts[index] += 1
+                    centroid = self._read_rows(index, index + 1)[0]
+                    centroid = centroid + (row - centroid) / self._counts[index]
+                    self._write_row(index, self._normalize(centroid))
+                    self._clock += 1
+                    self._last_used[index] = self._clock
+                    return
+            index = self._insert(row, value)
+            self._counts[index] = 1
+
+    def clear(self) -> None:
+        """Remove all clusters and reset the hit/miss counters."""
+        super().clear()
+        self._counts[:] = 0
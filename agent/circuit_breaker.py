@@ -0,0 +1,57 @@
+"""
+Circuit breaker used by the State Agent to stop calling Amazon Comprehend
+or OpenAI while they are failing or throttling, instead of paying for
+every failed call.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Thread-safe consecutive-failure circuit breaker.
+
+    After ``fail_max`` consecutive failures the breaker opens for
+    ``reset_timeout`` seconds. Once the timeout passes, calls are let
+    through again: a success closes the breaker, another failure reopens it.
+    """
+
+    def __init__(self, fail_max: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the breaker in the closed state.
+
+        Args:
+            fail_max: Consecutive failures that open the breaker
+            reset_timeout: Seconds to stay open before allowing a trial call
+        """
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls should currently be short-circuited."""
+        with self._lock:
+            return (self._opened_at is not None
+                    and time.monotonic() - self._opened_at < self.reset_timeout)
+
+    def record_success(self) -> None:
+        """Close the breaker and reset the failure count."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the breaker once fail_max is reached."""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.fail_max:
+                self._opened_at = time.monotonic()
@@ -0,0 +1,107 @@
+"""
+Thread-level coalescing of single-text Comprehend sentiment calls.
+
+Requests are processed in worker threads, so concurrent analyze_sentiment
+calls, including those carrying conversation history that the async
+request batcher passes through, are gathered here for a few milliseconds
+and sent as one BatchDetectSentiment call.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class _PendingText:
+    """A text waiting in a batch, and the result handed back to its caller."""
+
+    __slots__ = ('text', 'done', 'result', 'error')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class SentimentCoalescer:
+    """
+    Gathers concurrent sentiment requests into batches per language.
+
+    The first caller of a batch becomes its leader: it waits until the batch
+    holds max_batch_size texts or max_wait seconds have passed, then analyzes
+    the whole batch and hands each waiting caller its result.
+    """
+
+    def __init__(self, analyze_batch: Callable[[List[str], str], List[Dict[str, Any]]],
+                 max_batch_size: int = 25, max_wait: float = 0.01):
+        """
+        Initialize the coalescer.
+
+        Args:
+            analyze_batch: Function scoring a list of same-language texts, in order
+            max_batch_size: Texts that dispatch a batch without waiting (Comprehend's batch limit is 25)
+            max_wait: Seconds the leader waits for more texts
+        """
+        self.analyze_batch = analyze_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._batches: Dict[str, List[_PendingText]] = {}
+        self._condition = threading.Condition()
+
+    def analyze(self, text: str, language_code: str) -> Dict[str, Any]:
+        """
+        Analyze a text's sentiment as part of the next batch for its language.
+
+        Args:
+            text: Text to analyze
+            language_code: Language code for analysis
+
+        Returns:
+            Sentiment result as returned by analyze_batch
+        """
+        pending = _PendingText(text)
+        with self._condition:
+            batch = self._batches.get(language_code)
+            if batch is not None and len(batch) < self.max_batch_size:
+                batch.append(pending)
+                if len(batch) >= self.max_batch_size:
+                    self._condition.notify_all()
+                batch = None
+            else:
+                # A full batch whose leader has not woken yet is left to it
+                batch = self._batches[language_code] = [pending]
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                # Later arrivals start the next batch
+                if self._batches.get(language_code) is batch:
+                    del self._batches[language_code]
+
+        if batch is None:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+
+        try:
+            results = self.analyze_batch([item.text for item in batch], language_code)
+        except BaseException as e:
+            for item in batch:
+                item.error = e
+                item.done.set()
+            raise
+        for item, result in zip(batch, results):
+            item.result = result
+            item.done.set()
+        if len(results) < len(batch):
+            error = RuntimeError(f"Sentiment batch returned {len(results)} results for {len(batch)} texts")
+            for item in batch[len(results):]:
+                item.error = error
+                item.done.set()
+            if pending.error is not None:
+                raise error
+        return pending.result
@@ -0,0 +1,68 @@
+"""
+Client-side rate limiting used by the State Agent to stay under OpenAI's
+per-minute request and token limits instead of being throttled with 429s.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    Thread-safe token-bucket limiter for requests and tokens per minute.
+
+    Each bucket starts full and refills continuously at its per-minute rate,
+    so short bursts up to the limit go through immediately and sustained
+    load is spread out. acquire() blocks the calling thread until both
+    buckets can cover the request.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        """
+        Initialize the limiter with full buckets.
+
+        Args:
+            requests_per_minute: Requests allowed per minute
+            tokens_per_minute: Tokens allowed per minute, or None to limit requests only
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """Add the capacity accrued since the last refill; the lock must be held."""
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(self.requests_per_minute,
+                             self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int = 0) -> None:
+        """
+        Wait until one request and the given number of tokens are available, then take them.
+
+        Args:
+            tokens: Estimated tokens the request will use (capped at the per-minute limit)
+        """
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                request_wait = (1 - self._requests) * 60 / self.requests_per_minute
+                token_wait = ((tokens - self._tokens) * 60 / self.tokens_per_minute
+                              if self.tokens_per_minute else 0)
+                wait = max(request_wait, token_wait)
+                if wait <= 0:
+                    self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
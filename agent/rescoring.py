@@ -0,0 +1,151 @@
+"""
+Offline sentiment rescoring of stored analyses with Comprehend's
+asynchronous batch jobs, for collections too large to score call by call.
+"""
+
+import io
+import json
+import logging
+import tarfile
+import uuid
+from typing import Any, Dict, List, Optional
+
+from .state_agent import _fit_comprehend_text, _get_comprehend_client
+
+logger = logging.getLogger(__name__)
+
+
+class SentimentRescorer:
+    """
+    Runs StartSentimentDetectionJob over texts staged in S3.
+
+    Non-empty texts are written one per line, alongside an index file
+    recording which input each line came from, so the job's results (keyed
+    by line number) can be matched back to the input order. Jobs run for minutes,
+    so start() returns immediately and results() is called once status()
+    reports COMPLETED.
+    """
+
+    def __init__(self, s3_bucket: str, s3_prefix: str, data_access_role_arn: str,
+                 region_name: str = 'us-east-1'):
+        """
+        Initialize the rescorer.
+
+        Args:
+            s3_bucket: Bucket holding job input and output
+            s3_prefix: Key prefix under which each job gets its own folder
+            data_access_role_arn: IAM role Comprehend assumes to read and write the bucket
+            region_name: AWS region for Comprehend and S3
+        """
+        import boto3
+
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix.rstrip('/')
+        self.data_access_role_arn = data_access_role_arn
+        self.comprehend = _get_comprehend_client(region_name)
+        self.s3 = boto3.client('s3', region_name=region_name)
+
+    def start(self, texts: List[str], language_code: str = 'en') -> str:
+        """
+        Upload texts and start a sentiment detection job over them.
+
+        Args:
+            texts: Texts to score, all in the same language
+            language_code: Language code for analysis
+
+        Returns:
+            Comprehend job ID
+
+        Raises:
+            ValueError: If every text is empty
+        """
+        # Blank lines would shift Comprehend's line numbering, so empty texts are left out
+        indexes = [index for index, text in enumerate(texts) if text.split()]
+        if not indexes:
+            raise ValueError("No non-empty texts to rescore")
+
+        job_name = f"sentiment-rescore-{uuid.uuid4().hex[:12]}"
+        input_key = f"{self.s3_prefix}/{job_name}/input.txt"
+        # One document per line: newlines inside a text would split it
+        body = '\n'.join(_fit_comprehend_text(' '.join(texts[index].split())) for index in indexes)
+        self.s3.put_object(Bucket=self.s3_bucket, Key=input_key, Body=body.encode('utf-8'))
+        self.s3.put_object(
+            Bucket=self.s3_bucket,
+            Key=_index_key(input_key),
+            Body=json.dumps({'count': len(texts), 'indexes': indexes}).encode('utf-8')
+        )
+
+        response = self.comprehend.start_sentiment_detection_job(
+            JobName=job_name,
+            LanguageCode=language_code,
+            DataAccessRoleArn=self.data_access_role_arn,
+            InputDataConfig={
+                'S3Uri': f"s3://{self.s3_bucket}/{input_key}",
+                'InputFormat': 'ONE_DOC_PER_LINE'
+            },
+            OutputDataConfig={'S3Uri': f"s3://{self.s3_bucket}/{self.s3_prefix}/{job_name}/output/"}
+        )
+        logger.info("Started sentiment rescoring job %s for %d texts", response['JobId'], len(texts))
+        return response['JobId']
+
+    def status(self, job_id: str) -> str:
+        """
+        Get a job's status.
+
+        Args:
+            job_id: Job ID returned by start()
+
+        Returns:
+            Comprehend job status, e.g. IN_PROGRESS, COMPLETED or FAILED
+        """
+        response = self.comprehend.describe_sentiment_detection_job(JobId=job_id)
+        return response['SentimentDetectionJobProperties']['JobStatus']
+
+    def results(self, job_id: str) -> List[Optional[Dict[str, Any]]]:
+        """
+        Download a completed job's results.
+
+        Args:
+            job_id: Job ID returned by start()
+
+        Returns:
+            Sentiment result in Comprehend's response shape for each input
+            text, in input order; None for empty texts and documents the
+            job failed on
+        """
+        properties = self.comprehend.describe_sentiment_detection_job(
+            JobId=job_id
+        )['SentimentDetectionJobProperties']
+        if properties['JobStatus'] != 'COMPLETED':
+            raise RuntimeError(f"Sentiment rescoring job {job_id} is {properties['JobStatus']}")
+
+        bucket, key = properties['InputDataConfig']['S3Uri'][len('s3://'):].split('/', 1)
+        index = json.loads(self.s3.get_object(Bucket=bucket, Key=_index_key(key))['Body'].read())
+
+        bucket, key = properties['OutputDataConfig']['S3Uri'][len('s3://'):].split('/', 1)
+        archive = self.s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+        by_line: Dict[int, Dict[str, Any]] = {}
+        with tarfile.open(fileobj=io.BytesIO(archive), mode='r:gz') as tar:
+            for member in tar.getmembers():
+                if not member.isfile():
+                    continue
+                for line in tar.extractfile(member):
+                    record = json.loads(line)
+                    if 'Sentiment' in record:
+                        by_line[record['Line']] = {
+                            'Sentiment': record['Sentiment'],
+                            'SentimentScore': record['SentimentScore']
+                        }
+                    else:
+                        logger.error("Rescoring failed for line %s: %s", record.get('Line'), record.get('ErrorMessage'))
+
+        results: List[Optional[Dict[str, Any]]] = [None] * index['count']
+        for line, input_index in enumerate(index['indexes']):
+            results[input_index] = by_line.get(line)
+        return results
+
+
+def _index_key(input_key: str) -> str:
+    """S3 key of the line-to-input index written next to a job's input file."""
+    return input_key.rsplit('/', 1)[0] + '/index.json'
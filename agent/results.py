@@ -0,0 +1,59 @@
+"""
+Compact result type for emotion analyses held in memory by the State Agent.
+"""
+
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional
+
+
+@dataclass(slots=True, frozen=True)
+class EmotionResult:
+    """
+    Immutable, slotted form of a process_text result.
+
+    Results kept alive in the agent's caches use this type instead of a
+    dict, which avoids a per-result hash table. Callers still receive plain
+    dicts via to_dict(), so the API response shape is unchanged.
+    """
+
+    input_text: str
+    rephrased_text: Optional[str]
+    original_text: str
+    language: Optional[str]
+    sentiment: str
+    sentiment_scores: Dict[str, float]
+    emotion: str
+    valence: float
+    arousal: float
+    confidence: float
+    adaptive_response: str
+    session_id: Optional[str]
+    timestamp: str
+    degraded: bool = False
+    cached: bool = False
+
+    @classmethod
+    def from_dict(cls, result: Dict[str, Any]) -> "EmotionResult":
+        """
+        Build an EmotionResult from a process_text result dict.
+
+        Args:
+            result: Analysis result dict
+
+        Returns:
+            Equivalent EmotionResult
+        """
+        return cls(**{field.name: result[field.name] for field in fields(cls) if field.name in result})
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert to the dict returned by process_text.
+
+        The degraded and cached flags are only included when set.
+        """
+        result = {field.name: getattr(self, field.name) for field in fields(self)}
+        if not self.degraded:
+            del result['degraded']
+        if not self.cached:
+            del result['cached']
+        return result
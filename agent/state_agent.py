@@ -3,17 +3,705 @@ State Agent for Emotion Detection using Amazon Comprehend
 Handles text analysis, emotion mapping, and intelligent responses
 """
 
-import boto3
+import asyncio
+import difflib
+import functools
+import hashlib
+import json
 import logging
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Any, Final, Iterator, Mapping, Optional, List, Tuple, Union
 import re
 import os
-import openai
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from types import MappingProxyType
+import numpy as np
+from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
+from .cache import CentroidCache, LRUCache, SemanticCache
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .coalescing import SentimentCoalescer
+from .rate_limit import RateLimiter
+from .results import EmotionResult
+from .trends import ConversationStats, SessionBuffer
+
+if TYPE_CHECKING:
+    import openai
+
+# Read .env once at import rather than on every StateAgent construction
+load_dotenv()
+
 logger = logging.getLogger(__name__)
 
+# Precompiled pattern used by preprocess_text for non-ASCII input
+_STRIP_RE = re.compile(r"[^\w\s.,!?;:'-]")
+
+# str.translate table deleting the ASCII characters _STRIP_RE would remove
+_ASCII_KEEP = frozenset(string.ascii_letters + string.digits + string.whitespace + "_.,!?;:'-")
+_ASCII_STRIP_TABLE = str.maketrans('', '', ''.join(chr(c) for c in range(128) if chr(c) not in _ASCII_KEEP))
+
+# Shared pool for overlapping independent network calls within a request
+_IO_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix='state-agent-io')
+
+# (epoch second, formatted prefix) reused by _utc_timestamp within the same second
+_timestamp_prefix = (0, '')
+
+
+def _utc_timestamp() -> str:
+    """
+    Current UTC time as an ISO 8601 string with millisecond precision.
+    
+    The date/time prefix is formatted at most once per second and reused,
+    so the per-request cost is a clock read and a short string join.
+    """
+    global _timestamp_prefix
+    seconds, nanoseconds = divmod(time.time_ns(), 1_000_000_000)
+    cached_second, prefix = _timestamp_prefix
+    if seconds != cached_second:
+        prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+        _timestamp_prefix = (seconds, prefix)
+    return f"{prefix}.{nanoseconds // 1_000_000:03d}+00:00"
+
+
+@functools.lru_cache(maxsize=8)
+def _get_openai_client(api_key: str) -> "openai.OpenAI":
+    """
+    Build the OpenAI client for an API key, shared by every StateAgent.
+    
+    One pooled HTTP/2 connection set is kept alive across requests and agent
+    instances, so ChatGPT calls after warmup skip the TCP/TLS handshake.
+    The SDK is imported here rather than at module load, since importing
+    it takes most of a second.
+    """
+    import httpx
+    import openai
+    
+    http_client = httpx.Client(
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100)
+    )
+    return openai.OpenAI(api_key=api_key, http_client=http_client)
+
+
+
+@functools.lru_cache(maxsize=8)
+def _get_comprehend_client(region_name: str):
+    """
+    Build the Comprehend client for a region, shared by every StateAgent.
+    
+    Adaptive retries back off on throttling and rate-limit the client, and
+    the larger keepalive pool (COMPREHEND_POOL, default 50) lets concurrent
+    requests reuse TLS connections. boto3 clients are thread-safe, so one
+    instance serves all agents. boto3 is imported on first use.
+    """
+    import boto3
+    from botocore.config import Config
+    
+    return boto3.client(
+        'comprehend',
+        region_name=region_name,
+        config=Config(
+            retries={'max_attempts': 5, 'mode': 'adaptive'},
+            max_pool_connections=int(os.getenv('COMPREHEND_POOL', '50')),
+            tcp_keepalive=True
+        )
+    )
+
+
+# Maximum number of documents Comprehend accepts in one batch request
+_COMPREHEND_BATCH_SIZE = 25
+
+# Largest document, in UTF-8 bytes, that Comprehend's sentiment APIs accept
+_COMPREHEND_MAX_BYTES = 5000
+
+
+def _fit_comprehend_text(text: str) -> str:
+    """
+    Trim text to Comprehend's UTF-8 size limit, keeping its end.
+    
+    Context-enhanced inputs put the current message last, so the oldest
+    context is what gets dropped. ASCII text within the limit is returned
+    without encoding.
+    
+    Args:
+        text: Text to send to Comprehend
+        
+    Returns:
+        Text of at most _COMPREHEND_MAX_BYTES UTF-8 bytes
+    """
+    if len(text) <= _COMPREHEND_MAX_BYTES and text.isascii():
+        return text
+    encoded = text.encode('utf-8')
+    if len(encoded) <= _COMPREHEND_MAX_BYTES:
+        return text
+    return encoded[-_COMPREHEND_MAX_BYTES:].decode('utf-8', 'ignore')
+
+
+_SENTENCE_RE = re.compile(r'[^.!?]+[.!?]*|[.!?]+')
+
+
+def _split_word(word: str, max_bytes: int) -> List[str]:
+    """
+    Split a word into pieces of at most max_bytes UTF-8 bytes on character boundaries.
+    
+    Args:
+        word: Word longer than max_bytes
+        max_bytes: Maximum UTF-8 size of a piece
+        
+    Returns:
+        Pieces that concatenate back to the word
+    """
+    pieces: List[str] = []
+    start, size = 0, 0
+    for index, char in enumerate(word):
+        char_bytes = len(char.encode('utf-8'))
+        if size + char_bytes > max_bytes:
+            pieces.append(word[start:index])
+            start, size = index, 0
+        size += char_bytes
+    pieces.append(word[start:])
+    return pieces
+
+
+def _shard_comprehend_text(text: str, max_bytes: int = _COMPREHEND_MAX_BYTES) -> List[str]:
+    """
+    Split text into shards within Comprehend's UTF-8 size limit.
+    
+    Whole sentences are packed greedily into each shard; a sentence longer
+    than the limit is split on words, and a word longer than the limit on
+    characters.
+    
+    Args:
+        text: Text to split
+        max_bytes: Maximum UTF-8 size of a shard
+        
+    Returns:
+        Non-empty shards that together cover the text, in order
+    """
+    pieces: List[str] = []
+    for sentence in _SENTENCE_RE.findall(text):
+        if len(sentence.encode('utf-8')) <= max_bytes:
+            pieces.append(sentence)
+            continue
+        for position, word in enumerate(sentence.split(' ')):
+            if position:
+                pieces.append(' ')
+            if len(word.encode('utf-8')) <= max_bytes:
+                pieces.append(word)
+            else:
+                pieces.extend(_split_word(word, max_bytes))
+    
+    shards: List[str] = []
+    current, current_bytes = [], 0
+    for piece in pieces:
+        piece_bytes = len(piece.encode('utf-8'))
+        if current and current_bytes + piece_bytes > max_bytes:
+            shards.append(''.join(current).strip())
+            current, current_bytes = [], 0
+        current.append(piece)
+        current_bytes += piece_bytes
+    if current:
+        shards.append(''.join(current).strip())
+    return [shard for shard in shards if shard]
+
+
+# Comprehend error codes that indicate throttling rather than a bad request
+_THROTTLING_ERROR_CODES = frozenset({'ThrottlingException', 'TooManyRequestsException'})
+
+# Conversational system prompt pieces. Per-turn analysis is appended after the
+# static text so every request shares the same prefix for OpenAI prompt caching.
+_CONVERSATION_PROMPT_INTRO: Final = """You are an emotionally intelligent AI assistant whose responses are PRIMARILY driven by the user's emotional state detected by Amazon Comprehend. Your response style, tone, and content must adapt based on their emotional analysis."""
+
+# Instructions for each response strategy, keyed by strategy name
+_STRATEGY_PROMPTS: Final = MappingProxyType({
+    'HIGHLY_EXCITED_DETAILED_EXPLORATION': """1. **HIGHLY_EXCITED_DETAILED_EXPLORATION** (Valence: 0.6-1, Arousal: 0.6-1):
+   - User is HIGHLY ENTHUSIASTIC and seeking COMPREHENSIVE, DETAILED answers
+   - Provide EXTENSIVE, well-researched responses with multiple examples
+   - Include data, statistics, and supporting evidence
+   - Use VERY ENTHUSIASTIC language that matches their high energy
+   - Ask multiple follow-up questions to explore topics deeply
+   - Provide comprehensive explanations with multiple perspectives
+   - Match their excitement level""",
+    'HIGHLY_STRESSED_URGENT_SUPPORT': """2. **HIGHLY_STRESSED_URGENT_SUPPORT** (Valence: -1 to -0.6, Arousal: 0.6-1):
+   - User is HIGHLY DISTRESSED and needs IMMEDIATE, CRITICAL support
+   - Keep responses EXTREMELY SHORT and DIRECT
+   - Provide immediate, actionable solutions
+   - Use calm, reassuring language
+   - Focus on urgent, practical help
+   - Avoid any unnecessary details or tangents
+   - Be supportive and understanding""",
+    'HIGHLY_DEPRESSED_GENTLE_SUPPORT': """3. **HIGHLY_DEPRESSED_GENTLE_SUPPORT** (Valence: -1 to -0.6, Arousal: 0-0.4):
+   - User is HIGHLY DEPRESSED and needs GENTLE, COMPASSIONATE support
+   - Use warm, gentle, and encouraging language
+   - Provide simple, positive reinforcement
+   - Avoid overwhelming them with information
+   - Focus on small, achievable steps
+   - Be patient and understanding
+   - Offer emotional support and validation""",
+    'HIGHLY_CONTENT_DEEP_CONVERSATION': """4. **HIGHLY_CONTENT_DEEP_CONVERSATION** (Valence: 0.6-1, Arousal: 0-0.4):
+   - User is HIGHLY CONTENT and seeking MEANINGFUL, DEEP conversation
+   - Engage in thoughtful, philosophical discussions
+   - Ask profound, reflective questions
+   - Share insights and personal experiences
+   - Create a warm, intimate conversational tone
+   - Encourage deep thinking and self-reflection
+   - Build on their positive emotional state""",
+    'EXCITED_DETAILED_SEARCH': """5. **EXCITED_DETAILED_SEARCH** (Valence: 0.2-0.8, Arousal: 0.5-0.9):
+   - User is seeking DETAILED, COMPREHENSIVE answers
+   - Provide thorough, well-researched responses with supporting evidence
+   - Include specific examples, data, and backing information
+   - Use engaging, enthusiastic language that matches their energy
+   - Ask follow-up questions to dive deeper into topics
+   - Provide multiple perspectives and detailed explanations""",
+    'STRESSED_URGENT_CLEAR': """6. **STRESSED_URGENT_CLEAR** (Valence: -0.8 to -0.2, Arousal: 0.5-0.9):
+   - User needs URGENT, CLEAR, TO-THE-POINT answers
+   - Keep responses SHORT and DIRECT - no rambling or unnecessary details
+   - Provide immediate, actionable solutions
+   - Use clear, concise language
+   - Focus on practical, urgent help
+   - Avoid lengthy explanations or tangents""",
+    'BORED_SIMPLE_CLEAR': """7. **BORED_SIMPLE_CLEAR** (Valence: -0.8 to -0.2, Arousal: 0.1-0.5):
+   - User needs SIMPLE, CLEAR answers
+   - Use straightforward, easy-to-understand language
+   - Keep responses concise but complete
+   - Avoid complex jargon or lengthy explanations
+   - Make information digestible and engaging
+   - Use simple, direct communication""",
+    'CALM_ENGAGING_CONVERSATION': """8. **CALM_ENGAGING_CONVERSATION** (Valence: 0.2-0.8, Arousal: 0.1-0.5):
+   - User needs ENGAGING, TWO-WAY conversation
+   - Ask thoughtful questions to encourage dialogue
+   - Share personal insights and experiences
+   - Create a conversational, friendly tone
+   - Encourage back-and-forth discussion
+   - Make the interaction feel like a natural conversation""",
+    'UNCERTAIN_BUT_ENERGETIC_EXPLORATION': """9. **UNCERTAIN_BUT_ENERGETIC_EXPLORATION** (Valence: -0.2-0.2, Arousal: 0.6-1):
+   - User is uncertain but energetic - needs GUIDANCE and DIRECTION
+   - Provide clear, structured information
+   - Help them explore options and possibilities
+   - Use encouraging, supportive language
+   - Offer multiple approaches to their question
+   - Help them clarify their needs""",
+    'UNCERTAIN_CALM_GUIDANCE': """10. **UNCERTAIN_CALM_GUIDANCE** (Valence: -0.2-0.2, Arousal: 0-0.4):
+    - User is uncertain and calm - needs GENTLE GUIDANCE
+    - Provide clear, simple explanations
+    - Use patient, understanding language
+    - Offer step-by-step guidance
+    - Help them build confidence
+    - Be supportive and encouraging""",
+    'MIXED_EMOTIONS_ADAPTIVE_SUPPORT': """11. **MIXED_EMOTIONS_ADAPTIVE_SUPPORT** (Any valence, moderate arousal):
+    - User has mixed emotions - needs ADAPTIVE, FLEXIBLE support
+    - Acknowledge the complexity of their situation
+    - Provide balanced, nuanced responses
+    - Use empathetic, understanding language
+    - Help them sort through their feelings
+    - Be patient and non-judgmental""",
+    'FEEDBACK_PROBLEM_SOLVING': """12. **FEEDBACK_PROBLEM_SOLVING** (User gave negative feedback):
+    - User is frustrated with previous response - needs IMMEDIATE BETTER ANSWER
+    - DO NOT apologize or be defensive
+    - IMMEDIATELY provide what they asked for
+    - Be DIRECT and ACTIONABLE
+    - Focus on SOLVING their problem, not explaining
+    - Give them exactly what they need, better than before
+    - Ask SPECIFIC follow-up questions to get better information
+    - Be HELPFUL, not apologetic""",
+})
+
+_CONVERSATION_PROMPT_RULES: Final = """CRITICAL RULES:
+- Your response MUST match the specific strategy for their emotional state
+- Adjust your response length and complexity based on their arousal level
+- Match their energy level (high arousal = energetic, low arousal = calm)
+- Provide the type of answer they're seeking based on their emotional state
+- Use emotional intelligence in every interaction WITHOUT explicitly mentioning their mood
+- Respond naturally and conversationally
+- PRIORITIZE their emotional state over generic responses
+- When users give feedback (like "make it shorter" or "I didn't like that"), IMMEDIATELY provide a better response
+- Focus on SOLVING their problem, not apologizing
+- Be ACTIONABLE and HELPFUL, not defensive
+- Ask SPECIFIC follow-up questions to get better information
+- Provide CONCRETE, USEFUL information they can actually use
+
+AVOID:
+- Generic responses that ignore emotional context
+- Being emotionally tone-deaf to their state
+- Overwhelming someone who's already distressed
+- Being dismissive of their feelings
+- Providing the wrong type of response for their emotional state
+- Explicitly mentioning their detected mood or emotional state
+- Clinical or analytical language about their emotions
+- Defensive responses when users give feedback
+- Vague "I'm sorry" responses that don't solve the problem
+- Asking "How can I help?" without providing actual help first
+- Wasting time with apologies instead of better answers"""
+
+_CONVERSATION_SYSTEM_PROMPT: Final = (
+    _CONVERSATION_PROMPT_INTRO
+    + "\n\nENHANCED RESPONSE STRATEGIES BASED ON VALENCE AND AROUSAL:\n\n"
+    + "\n\n".join(_STRATEGY_PROMPTS.values())
+    + "\n\n" + _CONVERSATION_PROMPT_RULES
+)
+
+# Appended to the conversational prompt when rephrase and response share one call
+_SINGLE_PASS_INSTRUCTIONS = """
+
+OUTPUT FORMAT:
+Return a JSON object with exactly two string fields:
+- "rephrased": the user's message rewritten so its emotional content is explicit, preserving its original meaning and without adding emotions that aren't implied
+- "response": your conversational reply to the user"""
+
+
+# System prompt for rephrase_with_chatgpt and rephrase_batch_with_chatgpt
+_REPHRASE_SYSTEM_PROMPT = """You are an expert in emotional intelligence and text analysis. Your task is to enhance user input to make their emotional state more explicit and analyzable while preserving their original meaning and intent.
+
+ENHANCEMENT GUIDELINES:
+1. **Preserve Original Meaning**: Keep the core message intact
+2. **Clarify Emotional Context**: Make implicit emotions more explicit
+3. **Maintain Authenticity**: Don't add emotions that aren't implied
+4. **Improve Clarity**: Make the emotional undertones clearer
+5. **Keep Natural**: Ensure the enhanced text sounds natural
+
+EXAMPLES:
+- "I'm tired" → "I'm feeling exhausted and drained"
+- "Work is hard" → "I'm feeling overwhelmed and stressed about work"
+- "I'm excited!" → "I'm feeling enthusiastic and excited about this opportunity"
+
+Focus on making the emotional content more analyzable while keeping it authentic."""
+
+# Appended to the rephrase prompt when several texts share one call
+_BATCH_REPHRASE_INSTRUCTIONS = """
+
+You will receive a numbered list of texts. Enhance each one independently.
+
+OUTPUT FORMAT:
+Return a JSON object with a single field "results": an array with one object per input text, each with an integer "index" (the text's number in the list) and a string "rephrased" (the enhanced text)"""
+
+
+def _estimate_request_tokens(request: Mapping[str, Any]) -> int:
+    """
+    Rough token count of a chat completion request for rate limiting.
+    
+    Uses about four characters per prompt token plus the completion budget,
+    which is close enough for English text without loading a tokenizer.
+    """
+    prompt_chars = sum(len(message.get('content') or '') for message in request.get('messages', ()))
+    return prompt_chars // 4 + request.get('max_tokens', 0)
+
+
+# Characters ignored when matching an input against previously processed ones
+_CACHE_NORMALIZE_RE = re.compile(r"[^\w\s]")
+
+
+def _result_cache_key(cleaned_text: str, conversation_history: Optional[List[Dict]] = None) -> bytes:
+    """
+    Build the process_text cache key for an input and its conversation history.
+    
+    Case, punctuation and spacing are ignored so trivially different phrasings
+    of the same message ("I feel sad" / "i feel sad.") share one entry.
+    """
+    normalized = ' '.join(_CACHE_NORMALIZE_RE.sub('', cleaned_text.casefold()).split())
+    digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=16)
+    if conversation_history:
+        digest.update(json.dumps(conversation_history, sort_keys=True, default=str).encode('utf-8'))
+    return digest.digest()
+
+
+# Comprehend sentiment -> emotion details, shared read-only by every StateAgent
+_EMOTION_MAPPING: Final[Mapping[str, Mapping[str, Any]]] = MappingProxyType({
+    "POSITIVE": MappingProxyType({
+        "emotion": "Joy / Optimism / Excitement",
+        "valence": 0.8,
+        "arousal": 0.6,
+        "response_template": "That sounds great! I'd love to hear more about what's going well for you.",
+        "emotional_indicators": ("happy", "excited", "optimistic", "enthusiastic", "grateful"),
+        "response_style": "enthusiastic and celebratory"
+    }),
+    "NEGATIVE": MappingProxyType({
+        "emotion": "Sadness / Anger / Fear / Frustration",
+        "valence": -0.8,
+        "arousal": 0.7,
+        "response_template": "I can hear that this is really difficult for you. I'm here to listen and help however I can.",
+        "emotional_indicators": ("sad", "angry", "frustrated", "worried", "disappointed"),
+        "response_style": "empathetic and supportive"
+    }),
+    "NEUTRAL": MappingProxyType({
+        "emotion": "Calm / Indifference / Contemplative",
+        "valence": 0.0,
+        "arousal": 0.2,
+        "response_template": "I appreciate you sharing that with me. How can I help you today?",
+        "emotional_indicators": ("calm", "neutral", "thoughtful", "balanced", "content"),
+        "response_style": "gentle and exploratory"
+    }),
+    "MIXED": MappingProxyType({
+        "emotion": "Conflicted / Uncertain / Ambivalent",
+        "valence": 0.2,
+        "arousal": 0.5,
+        "response_template": "It sounds like you're working through some complex thoughts. I'm here to help you sort through things.",
+        "emotional_indicators": ("conflicted", "uncertain", "torn", "ambivalent", "confused"),
+        "response_style": "patient and understanding"
+    })
+})
+
+@dataclass(slots=True, frozen=True)
+class _EmotionEntry:
+    """The fields of an emotion mapping entry read on every request."""
+    
+    emotion: str
+    valence: float
+    arousal: float
+    response_template: str
+
+
+# Per-sentiment entries used by map_sentiment_to_emotion
+_EMOTION_ENTRIES: Final[Mapping[str, _EmotionEntry]] = MappingProxyType({
+    sentiment: _EmotionEntry(details['emotion'], details['valence'], details['arousal'], details['response_template'])
+    for sentiment, details in _EMOTION_MAPPING.items()
+})
+
+# Words that already state an emotion plainly, so ChatGPT rephrasing adds little
+_EXPLICIT_EMOTION_WORDS = frozenset(
+    word for details in _EMOTION_MAPPING.values() for word in details['emotional_indicators']
+) | frozenset({
+    "afraid", "aggravated", "agitated", "alarmed", "amazed", "amused", "angered", "angry",
+    "annoyed", "anxious", "apprehensive", "ashamed", "astonished", "awful", "awkward",
+    "betrayed", "bitter", "blessed", "bored", "brokenhearted", "calm", "cheerful",
+    "comfortable", "concerned", "confident", "contented", "crushed", "curious", "defeated",
+    "dejected", "delighted", "depressed", "desperate", "devastated", "disappointed",
+    "discouraged", "disgusted", "dismayed", "distressed", "disturbed", "drained",
+    "dread", "eager", "ecstatic", "elated", "embarrassed", "energized", "enraged",
+    "envious", "euphoric", "exasperated", "excited", "exhausted", "fearful", "fond",
+    "frightened", "frustrated", "fulfilled", "furious", "gloomy", "glad",
+    "grateful", "grief", "grieving", "guilty", "happy", "hate", "heartbroken", "helpless",
+    "homesick", "hopeful", "hopeless", "horrified", "hostile", "humiliated", "hurt",
+    "impatient", "indifferent", "inspired", "insecure", "irritated", "jealous", "joyful",
+    "joyous", "lonely", "love", "loved", "mad", "melancholy", "miserable",
+    "motivated", "nervous", "numb", "offended", "optimistic", "outraged", "overjoyed",
+    "overwhelmed", "panicked", "panicking", "peaceful", "pessimistic", "pleased", "proud",
+    "rage", "regretful", "rejected", "relaxed", "relieved", "remorseful", "resentful",
+    "restless", "sad", "satisfied", "scared", "secure", "shocked", "shy", "sorrowful",
+    "sorry", "stressed", "stunned", "tense", "terrified", "thankful", "thrilled",
+    "tired", "troubled", "uncomfortable", "uneasy", "unhappy", "upset", "useless",
+    "vulnerable", "weary", "worried", "worthless", "wretched"
+})
+
+# Characters of input text used as the language cache key
+_LANGUAGE_CACHE_PREFIX = 128
+
+# Consecutive same-language detections after which a session skips detection
+_STICKY_LANGUAGE_STREAK = 5
+
+# Sentiment confidence below which a session's sticky language is re-checked
+_STICKY_LANGUAGE_MIN_CONFIDENCE = 0.3
+
+# Rephrases at least this similar to their input reuse the speculative sentiment
+_REPHRASE_SIMILARITY_THRESHOLD = 0.8
+
+# Inputs with fewer words or characters than this are sent to Comprehend without rephrasing
+_REPHRASE_MIN_WORDS = 6
+_REPHRASE_MIN_CHARS = 12
+
+
+# VADER compound score beyond which the local sentiment result is trusted over Comprehend
+_LOCAL_SENTIMENT_MIN_COMPOUND: Final = 0.6
+# Texts shorter than this carry too little signal to be worth a Comprehend call
+_LOCAL_SENTIMENT_MAX_CHARS: Final = 8
+
+
+# Characters of each earlier message, and total UTF-8 bytes of exchanges,
+# included in the context prepended to a message before analysis
+_CONTEXT_SNIPPET_CHARS: Final = 80
+_MAX_CONTEXT_BYTES: Final = 1024
+
+
+def _context_snippet(message: Any) -> str:
+    """
+    Shorten an earlier message for the analysis context.
+    
+    Args:
+        message: Message text from the conversation history
+        
+    Returns:
+        The message, cut to _CONTEXT_SNIPPET_CHARS characters with an ellipsis if longer
+    """
+    message = str(message)
+    if len(message) <= _CONTEXT_SNIPPET_CHARS:
+        return message
+    return message[:_CONTEXT_SNIPPET_CHARS].rstrip() + '...'
+
+
+# Exchanges kept verbatim in the response prompt when older ones are summarized
+_RECENT_EXCHANGES: Final = 2
+
+
+def _conversation_key(conversation_history: List[Dict]) -> Tuple[str, str, str]:
+    """
+    Identify a conversation by its first exchange, which stays fixed as it grows.
+    
+    Args:
+        conversation_history: Non-empty conversation history
+        
+    Returns:
+        Key for per-conversation caches
+    """
+    first = conversation_history[0]
+    return (str(first.get('user')), str(first.get('assistant')), str(first.get('timestamp')))
+
+
+# Phrases marking a message as feedback on the previous response, matched
+# against the lowercased text in a single scan
+_FEEDBACK_INDICATORS = (
+    "didn't like", "don't like", "hate", "terrible", "awful", "bad",
+    "make it shorter", "make it better", "too long", "too short",
+    "not helpful", "useless", "waste of time", "stupid",
+    "give me", "I want", "I need", "show me", "tell me"
+)
+_FEEDBACK_RE = re.compile('|'.join(re.escape(indicator) for indicator in _FEEDBACK_INDICATORS))
+
+
+@functools.lru_cache(maxsize=1024)
+def _emotional_intensity(confidence: float, valence: float, arousal: float) -> str:
+    """
+    Intensity label for an emotional state; see StateAgent._calculate_emotional_intensity.
+    
+    Inputs come from map_sentiment_to_emotion, rounded to two decimals, so
+    only a few hundred distinct states occur and repeats are served from cache.
+    """
+    valence = abs(valence)
+
+    # Calculate intensity based on confidence, valence magnitude, and arousal
+    intensity_score = (confidence * 0.4) + (valence * 0.3) + (arousal * 0.3)
+
+    if intensity_score > 0.7:
+        return "Very High"
+    elif intensity_score > 0.5:
+        return "High"
+    elif intensity_score > 0.3:
+        return "Moderate"
+    else:
+        return "Low"
+
+
+@functools.lru_cache(maxsize=1024)
+def _response_strategy(valence: float, arousal: float, confidence: float) -> str:
+    """
+    Response strategy for an emotional state; see StateAgent._determine_response_strategy.
+    
+    Memoized like _emotional_intensity.
+    """
+    # Enhanced strategy determination with more granular emotional states
+
+    # HIGH CONFIDENCE EMOTIONAL STATES (confidence > 0.7)
+    if confidence > 0.7:
+        # Very Positive and Energetic (Valence: 0.6 to 1, Arousal: 0.6 to 1)
+        if 0.6 <= valence <= 1 and 0.6 <= arousal <= 1:
+            return "HIGHLY_EXCITED_DETAILED_EXPLORATION"
+
+        # Very Negative and Stressed (Valence: -1 to -0.6, Arousal: 0.6 to 1)
+        elif -1 <= valence <= -0.6 and 0.6 <= arousal <= 1:
+            return "HIGHLY_STRESSED_URGENT_SUPPORT"
+
+        # Very Negative and Low Energy (Valence: -1 to -0.6, Arousal: 0 to 0.4)
+        elif -1 <= valence <= -0.6 and 0 <= arousal <= 0.4:
+            return "HIGHLY_DEPRESSED_GENTLE_SUPPORT"
+
+        # Very Positive and Calm (Valence: 0.6 to 1, Arousal: 0 to 0.4)
+        elif 0.6 <= valence <= 1 and 0 <= arousal <= 0.4:
+            return "HIGHLY_CONTENT_DEEP_CONVERSATION"
+
+    # MODERATE CONFIDENCE EMOTIONAL STATES (confidence 0.4 to 0.7)
+    elif confidence > 0.4:
+        # Positive and Energetic (Valence: 0.2 to 0.8, Arousal: 0.5 to 0.9)
+        if 0.2 <= valence <= 0.8 and 0.5 <= arousal <= 0.9:
+            return "EXCITED_DETAILED_SEARCH"
+
+        # Negative and Stressed (Valence: -0.8 to -0.2, Arousal: 0.5 to 0.9)
+        elif -0.8 <= valence <= -0.2 and 0.5 <= arousal <= 0.9:
+            return "STRESSED_URGENT_CLEAR"
+
+        # Negative and Low Energy (Valence: -0.8 to -0.2, Arousal: 0.1 to 0.5)
+        elif -0.8 <= valence <= -0.2 and 0.1 <= arousal <= 0.5:
+            return "BORED_SIMPLE_CLEAR"
+
+        # Positive and Calm (Valence: 0.2 to 0.8, Arousal: 0.1 to 0.5)
+        elif 0.2 <= valence <= 0.8 and 0.1 <= arousal <= 0.5:
+            return "CALM_ENGAGING_CONVERSATION"
+
+    # LOW CONFIDENCE OR NEUTRAL STATES (confidence <= 0.4)
+    else:
+        # Neutral with high arousal (Valence: -0.2 to 0.2, Arousal: 0.6 to 1)
+        if -0.2 <= valence <= 0.2 and 0.6 <= arousal <= 1:
+            return "UNCERTAIN_BUT_ENERGETIC_EXPLORATION"
+
+        # Neutral with low arousal (Valence: -0.2 to 0.2, Arousal: 0 to 0.4)
+        elif -0.2 <= valence <= 0.2 and 0 <= arousal <= 0.4:
+            return "UNCERTAIN_CALM_GUIDANCE"
+
+        # Mixed emotions (any valence, moderate arousal)
+        else:
+            return "MIXED_EMOTIONS_ADAPTIVE_SUPPORT"
+
+    # Fallback for edge cases
+    return "ADAPTIVE_CONTEXTUAL"
+
+
+@functools.lru_cache(maxsize=1024)
+def _response_temperature(arousal: float, valence: float, confidence: float) -> float:
+    """
+    ChatGPT temperature for an emotional state; see StateAgent._calculate_response_temperature.
+    
+    Memoized like _emotional_intensity.
+    """
+    # Base temperature - more dynamic based on emotional state
+    base_temp = 0.5
+
+    # Arousal-based adjustment (higher arousal = more creative/energetic)
+    # Scale: 0.0 to 0.4 adjustment based on arousal
+    arousal_adjustment = arousal * 0.4
+
+    # Valence-based adjustment (extreme emotions = more creative)
+    # Scale: 0.0 to 0.3 adjustment based on valence magnitude
+    valence_adjustment = abs(valence) * 0.3
+
+    # Confidence-based adjustment (higher confidence = more focused, lower = more exploratory)
+    # Scale: -0.2 to 0.2 adjustment based on confidence
+    confidence_adjustment = (confidence - 0.5) * 0.4
+
+    # Emotional intensity bonus (very high or very low emotions get more creative)
+    emotional_intensity = abs(valence) + arousal
+    intensity_bonus = 0.0
+    if emotional_intensity > 1.2:  # Very intense emotions
+        intensity_bonus = 0.1
+    elif emotional_intensity < 0.3:  # Very calm emotions
+        intensity_bonus = -0.1
+
+    temperature = base_temp + arousal_adjustment + valence_adjustment + confidence_adjustment + intensity_bonus
+
+    # Clamp between 0.2 and 0.95 for more dynamic range
+    return max(0.2, min(0.95, temperature))
+
+
+def _needs_rephrase(text: str) -> bool:
+    """
+    Decide whether ChatGPT rephrasing is likely to help Comprehend with this input.
+    
+    Short inputs and inputs that name an emotion outright are analyzed as they are.
+    
+    Args:
+        text: Preprocessed user input
+        
+    Returns:
+        True if the input should be rephrased before sentiment analysis
+    """
+    if len(text) < _REPHRASE_MIN_CHARS:
+        return False
+    words = text.casefold().split()
+    if len(words) < _REPHRASE_MIN_WORDS:
+        return False
+    return not any(word.strip(".,!?;:'-") in _EXPLICIT_EMOTION_WORDS for word in words)
+
 
 class StateAgent:
     """
@@ -28,64 +716,120 @@ class StateAgent:
         Args:
             region_name: AWS region for Comprehend service
         """
-        load_dotenv()
-        
-        # Initialize AWS Comprehend
-        self.comprehend = boto3.client('comprehend', region_name=region_name)
+        # Initialize AWS Comprehend; the breaker stops calls during sustained failures
+        self.comprehend = _get_comprehend_client(region_name)
+        self.comprehend_breaker = CircuitBreaker(fail_max=5, reset_timeout=30)
+        self.comprehend_throttle_count = 0
         
         # Initialize OpenAI client
         openai_api_key = os.getenv('chatgptapi')
         if openai_api_key:
-            import openai
-            self.openai_client = openai.OpenAI(api_key=openai_api_key)
+            self.openai_client = _get_openai_client(openai_api_key)
         else:
             self.openai_client = None
             logger.warning("ChatGPT API key not found. ChatGPT features will be disabled.")
+        # While OpenAI keeps failing, ChatGPT steps fall back immediately
+        self.openai_breaker = CircuitBreaker(fail_max=5, reset_timeout=30)
+        # Optional client-side throttle to the account's requests/tokens per minute
+        self.openai_rate_limiter = None
+        if os.getenv('OPENAI_RPM'):
+            tokens_per_minute = os.getenv('OPENAI_TPM')
+            self.openai_rate_limiter = RateLimiter(
+                float(os.getenv('OPENAI_RPM')),
+                float(tokens_per_minute) if tokens_per_minute else None
+            )
         
-        self.emotion_mapping = self._initialize_emotion_mapping()
+        self.emotion_mapping = _EMOTION_MAPPING
+        
+        # Completed analyses (as EmotionResult) keyed by normalized input + conversation history;
+        # RESULT_CACHE_SIZE=0 disables it, and RESULT_CACHE_PATH keeps it across restarts
+        self._result_cache = LRUCache(maxsize=int(os.getenv('RESULT_CACHE_SIZE', '1024')))
+        self.result_cache_path = os.getenv('RESULT_CACHE_PATH')
+        if self.result_cache_path and os.path.exists(self.result_cache_path):
+            try:
+                self._result_cache.load(self.result_cache_path)
+                logger.info("Loaded %d result cache entries", len(self._result_cache))
+            except Exception as e:
+                logger.warning("Could not load result cache from %s: %s", self.result_cache_path, e)
+        # Successful detect_language (by text prefix) and rephrase_with_chatgpt outputs
+        self._language_cache = LRUCache(maxsize=4096)
+        self._rephrase_cache = LRUCache(maxsize=4096)
+        # Successful analyze_sentiment results keyed by (language code, text)
+        self._sentiment_cache = LRUCache(maxsize=4096)
+        # ChatGPT completions keyed by a hash of the full request (prompts and parameters)
+        self._completion_cache = LRUCache(maxsize=4096)
+        # (language, consecutive detections) per session for sticky language reuse
+        self._language_streaks = LRUCache(maxsize=10000)
+        
+        # Incremental emotional stats per conversation, keyed by its first exchange
+        self._conversation_stats = LRUCache(maxsize=10000)
+        self._conversation_stats_lock = threading.Lock()
+        
+        # Near-duplicate inputs (by embedding similarity) reuse earlier analyses
+        self._semantic_cache = None
+        self.semantic_cache_path = os.getenv('SEMANTIC_CACHE_PATH')
+        if self.openai_client and os.getenv('SEMANTIC_CACHE', 'false').lower() == 'true':
+            self._semantic_cache = SemanticCache(
+                maxsize=int(os.getenv('SEMANTIC_CACHE_SIZE', '1024')),
+                threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.85')),
+                quantize=os.getenv('SEMANTIC_CACHE_INT8', 'false').lower() == 'true'
+            )
+            # Entries saved by a previous process keep the cache warm across restarts
+            if self.semantic_cache_path and os.path.exists(self.semantic_cache_path):
+                try:
+                    self._semantic_cache.load(self.semantic_cache_path)
+                    logger.info("Loaded %d semantic cache entries", len(self._semantic_cache))
+                except Exception as e:
+                    logger.warning("Could not load semantic cache from %s: %s", self.semantic_cache_path, e)
+        
+        # Paraphrases of earlier inputs reuse their cluster's rephrase instead of calling ChatGPT
+        self._rephrase_clusters = None
+        if self.openai_client and os.getenv('REPHRASE_CLUSTER_CACHE', 'false').lower() == 'true':
+            self._rephrase_clusters = CentroidCache(
+                maxsize=4096, threshold=0.86, merge_threshold=0.7,
+                quantize=os.getenv('SEMANTIC_CACHE_INT8', 'false').lower() == 'true'
+            )
         
-    def _initialize_emotion_mapping(self) -> Dict[str, Dict[str, Any]]:
-        """
-        Initialize the emotion mapping from Comprehend sentiments to emotions.
+        # Run Comprehend on the unrephrased text while ChatGPT rephrases it, and only
+        # re-run it if the rephrase arrives within the grace period and differs materially
+        self.speculative_sentiment = os.getenv('SPECULATIVE_SENTIMENT', 'false').lower() == 'true'
+        self.rephrase_grace_seconds = float(os.getenv('REPHRASE_GRACE_SECONDS', '0.3'))
+        
+        # Send concurrent single-text sentiment calls to Comprehend as one batch call
+        self._sentiment_coalescer = None
+        if os.getenv('SENTIMENT_BATCHING', 'false').lower() == 'true':
+            self._sentiment_coalescer = SentimentCoalescer(self.analyze_sentiment_batch)
+        
+        # Classify short or clearly polar English texts locally instead of calling Comprehend
+        self._local_sentiment_analyzer = None
+        if os.getenv('LOCAL_SENTIMENT', 'false').lower() == 'true':
+            # Imported only when enabled; vaderSentiment is optional
+            try:
+                from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+                self._local_sentiment_analyzer = SentimentIntensityAnalyzer()
+            except ImportError:
+                logger.warning("LOCAL_SENTIMENT is set but vaderSentiment is not installed")
+        
+        # ChatGPT responses reused for the same message, emotional state and last exchange,
+        # regardless of older history, so repeated "thanks"/"ok" turns skip ChatGPT
+        self._response_cache = None
+        if os.getenv('RESPONSE_CACHE', 'false').lower() == 'true':
+            self._response_cache = LRUCache(maxsize=1024)
+        
+        # Replace all but the last two exchanges in the response prompt with a running
+        # ChatGPT summary, kept per conversation as (exchanges covered, last one, summary)
+        self.summarize_history = os.getenv('HISTORY_SUMMARY', 'false').lower() == 'true'
+        self._history_summaries = LRUCache(maxsize=10000)
+        
+        # Send only the selected strategy's instructions instead of all twelve
+        self.compact_system_prompt = os.getenv('COMPACT_SYSTEM_PROMPT', 'false').lower() == 'true'
+        
+        # Produce the rephrase and the response with one ChatGPT call instead of two
+        self.single_pass_llm = os.getenv('SINGLE_PASS_LLM', 'false').lower() == 'true'
+        
+        # Rephrase all texts of a process_text_batch call with one ChatGPT call
+        self.batch_rephrase = os.getenv('BATCH_REPHRASE', 'false').lower() == 'true'
         
-        Returns:
-            Dictionary mapping sentiments to emotion details
-        """
-        return {
-            "POSITIVE": {
-                "emotion": "Joy / Optimism / Excitement",
-                "valence": 0.8,
-                "arousal": 0.6,
-                "response_template": "That sounds great! I'd love to hear more about what's going well for you.",
-                "emotional_indicators": ["happy", "excited", "optimistic", "enthusiastic", "grateful"],
-                "response_style": "enthusiastic and celebratory"
-            },
-            "NEGATIVE": {
-                "emotion": "Sadness / Anger / Fear / Frustration",
-                "valence": -0.8,
-                "arousal": 0.7,
-                "response_template": "I can hear that this is really difficult for you. I'm here to listen and help however I can.",
-                "emotional_indicators": ["sad", "angry", "frustrated", "worried", "disappointed"],
-                "response_style": "empathetic and supportive"
-            },
-            "NEUTRAL": {
-                "emotion": "Calm / Indifference / Contemplative",
-                "valence": 0.0,
-                "arousal": 0.2,
-                "response_template": "I appreciate you sharing that with me. How can I help you today?",
-                "emotional_indicators": ["calm", "neutral", "thoughtful", "balanced", "content"],
-                "response_style": "gentle and exploratory"
-            },
-            "MIXED": {
-                "emotion": "Conflicted / Uncertain / Ambivalent",
-                "valence": 0.2,
-                "arousal": 0.5,
-                "response_template": "It sounds like you're working through some complex thoughts. I'm here to help you sort through things.",
-                "emotional_indicators": ["conflicted", "uncertain", "torn", "ambivalent", "confused"],
-                "response_style": "patient and understanding"
-            }
-        }
-    
     def preprocess_text(self, text: str) -> str:
         """
         Clean and preprocess input text.
@@ -99,11 +843,14 @@ class StateAgent:
         if not text or not text.strip():
             return ""
             
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text.strip())
+        # Remove excessive whitespace (str.split matches the same characters as \s)
+        text = ' '.join(text.split())
         
-        # Remove special characters but keep basic punctuation
-        text = re.sub(r'[^\w\s.,!?;:\'-]', '', text)
+        # Remove special characters but keep basic punctuation. ASCII input only
+        # needs the translate table; the regex covers non-ASCII characters.
+        text = text.translate(_ASCII_STRIP_TABLE)
+        if not text.isascii():
+            text = _STRIP_RE.sub('', text)
         
         return text
     
@@ -117,43 +864,257 @@ class StateAgent:
         Returns:
             Language code or None if detection fails
         """
+        # The language of a message is settled by its opening, so key on a prefix
+        cache_key = text[:_LANGUAGE_CACHE_PREFIX]
+        language = self._language_cache.get(cache_key)
+        if language is not None:
+            return language
+        
+        if self.comprehend_breaker.is_open:
+            return None
+        
         try:
-            response = self.comprehend.detect_dominant_language(Text=text)
-            languages = response['Languages']
-            if languages:
-                return languages[0]['LanguageCode']
+            response = self.comprehend.detect_dominant_language(Text=_fit_comprehend_text(text))
         except Exception as e:
-            logger.warning(f"Language detection failed: {e}")
+            self._record_comprehend_failure(e)
+            logger.warning("Language detection failed: %s", e)
+            return None
+        self.comprehend_breaker.record_success()
+        
+        languages = response['Languages']
+        if languages:
+            language = languages[0]['LanguageCode']
+            self._language_cache.put(cache_key, language)
+            return language
         return None
     
-    def analyze_sentiment(self, text: str, language_code: str = 'en') -> Dict[str, Any]:
+    def analyze_sentiment(self, text: Union[str, List[str]],
+                          language_code: str = 'en') -> Union[Dict[str, Any], List[Dict[str, Any]]]:
         """
         Analyze sentiment of the input text using Amazon Comprehend.
         
         Args:
-            text: Text to analyze
+            text: Text to analyze, or a list of texts to analyze with batched calls
             language_code: Language code for analysis
             
         Returns:
-            Sentiment analysis results
+            Sentiment analysis results (a list in input order when given a list)
         """
+        if isinstance(text, list):
+            return self.analyze_sentiment_batch(text, language_code)
+        
+        if not text or text.isspace():
+            return self._neutral_sentiment()
+        
+        # Oversized texts are scored in shards rather than trimmed
+        if len(text) > _COMPREHEND_MAX_BYTES // 4 and len(text.encode('utf-8')) > _COMPREHEND_MAX_BYTES:
+            return self.analyze_sentiment_long(text, language_code)
+        
+        local_result = self._local_sentiment(text, language_code)
+        if local_result is not None:
+            return local_result
+        
+        cached_result = self._sentiment_cache.get((language_code, text))
+        if cached_result is not None:
+            return cached_result
+        
+        if self.comprehend_breaker.is_open:
+            logger.warning("Comprehend circuit open, skipping sentiment analysis")
+            return self._neutral_sentiment()
+        
+        if self._sentiment_coalescer is not None:
+            return self._sentiment_coalescer.analyze(text, language_code)
+        
         try:
             response = self.comprehend.detect_sentiment(
                 Text=text,
                 LanguageCode=language_code
             )
-            return response
         except Exception as e:
-            logger.error(f"Sentiment analysis failed: {e}")
-            return {
-                'Sentiment': 'NEUTRAL',
-                'SentimentScore': {
-                    'Positive': 0.25,
-                    'Negative': 0.25,
-                    'Neutral': 0.5,
-                    'Mixed': 0.0
+            self._record_comprehend_failure(e)
+            logger.error("Sentiment analysis failed: %s", e)
+            return self._neutral_sentiment()
+        self.comprehend_breaker.record_success()
+        sentiment_result = {
+            'Sentiment': response['Sentiment'],
+            'SentimentScore': response['SentimentScore']
+        }
+        self._sentiment_cache.put((language_code, text), sentiment_result)
+        return sentiment_result
+    
+    def analyze_sentiment_long(self, text: str, language_code: str = 'en') -> Dict[str, Any]:
+        """
+        Analyze sentiment of a document of any length.
+        
+        Splits the text into shards within Comprehend's 5000-byte limit at
+        sentence boundaries, scores them with batched calls, and averages the
+        scores weighted by shard size. analyze_sentiment delegates here for
+        texts over the limit.
+        
+        Args:
+            text: Text to analyze
+            language_code: Language code for analysis
+            
+        Returns:
+            Sentiment analysis result in Comprehend's response shape
+        """
+        shards = _shard_comprehend_text(text)
+        if not shards:
+            return self._neutral_sentiment()
+        if len(shards) == 1:
+            return self.analyze_sentiment(shards[0], language_code)
+        
+        totals = {'Positive': 0.0, 'Negative': 0.0, 'Neutral': 0.0, 'Mixed': 0.0}
+        total_weight = 0
+        for shard, result in zip(shards, self.analyze_sentiment_batch(shards, language_code)):
+            if result.get('Degraded'):
+                continue
+            weight = len(shard.encode('utf-8'))
+            for label, score in result['SentimentScore'].items():
+                totals[label] += score * weight
+            total_weight += weight
+        if not total_weight:
+            return self._neutral_sentiment()
+        
+        scores = {label: total / total_weight for label, total in totals.items()}
+        return {'Sentiment': max(scores, key=scores.get).upper(), 'SentimentScore': scores}
+    
+    def _local_sentiment(self, text: str, language_code: str) -> Optional[Dict[str, Any]]:
+        """
+        Classify a text locally with VADER when the result is unambiguous.
+        
+        Args:
+            text: Text to analyze
+            language_code: Language code of the text
+            
+        Returns:
+            Sentiment result in Comprehend's response shape, or None if the
+            text should go to Comprehend
+        """
+        if self._local_sentiment_analyzer is None or language_code != 'en':
+            return None
+        compound = self._local_sentiment_analyzer.polarity_scores(text)['compound']
+        if abs(compound) <= _LOCAL_SENTIMENT_MIN_COMPOUND and len(text) >= _LOCAL_SENTIMENT_MAX_CHARS:
+            return None
+        
+        # Short texts below the polarity threshold count as neutral
+        strength = abs(compound)
+        if compound > _LOCAL_SENTIMENT_MIN_COMPOUND:
+            sentiment, scores = 'POSITIVE', {'Positive': strength, 'Negative': 0.0, 'Neutral': 1 - strength}
+        elif compound < -_LOCAL_SENTIMENT_MIN_COMPOUND:
+            sentiment, scores = 'NEGATIVE', {'Positive': 0.0, 'Negative': strength, 'Neutral': 1 - strength}
+        else:
+            sentiment, scores = 'NEUTRAL', {'Positive': max(compound, 0.0), 'Negative': max(-compound, 0.0),
+                                            'Neutral': 1 - strength}
+        scores['Mixed'] = 0.0
+        return {'Sentiment': sentiment, 'SentimentScore': scores, 'Local': True}
+    
+    def _record_comprehend_failure(self, error: Exception) -> None:
+        """
+        Count a failed Comprehend call towards the circuit breaker.
+        
+        Args:
+            error: Exception raised by the Comprehend client
+        """
+        if isinstance(error, ClientError) and error.response['Error']['Code'] in _THROTTLING_ERROR_CODES:
+            self.comprehend_throttle_count += 1
+        self.comprehend_breaker.record_failure()
+    
+    @staticmethod
+    def _neutral_sentiment() -> Dict[str, Any]:
+        """
+        Default sentiment used when Comprehend cannot analyze a text.
+        
+        Returns:
+            Neutral sentiment result in Comprehend's response shape, flagged as degraded
+        """
+        return {
+            'Sentiment': 'NEUTRAL',
+            'SentimentScore': {
+                'Positive': 0.25,
+                'Negative': 0.25,
+                'Neutral': 0.5,
+                'Mixed': 0.0
+            },
+            'Degraded': True
+        }
+    
+    def detect_language_batch(self, texts: List[str]) -> List[Optional[str]]:
+        """
+        Detect the dominant language of several texts with batched Comprehend calls.
+        
+        Args:
+            texts: Input texts to analyze
+            
+        Returns:
+            Language code (or None if detection failed) for each text, in input order
+        """
+        languages: List[Optional[str]] = [None] * len(texts)
+        for start in range(0, len(texts), _COMPREHEND_BATCH_SIZE):
+            chunk = texts[start:start + _COMPREHEND_BATCH_SIZE]
+            if self.comprehend_breaker.is_open:
+                logger.warning("Comprehend circuit open, skipping batch language detection")
+                break
+            try:
+                response = self.comprehend.batch_detect_dominant_language(
+                    TextList=[_fit_comprehend_text(text) for text in chunk]
+                )
+            except Exception as e:
+                self._record_comprehend_failure(e)
+                logger.warning("Batch language detection failed: %s", e)
+                continue
+            self.comprehend_breaker.record_success()
+            for item in response.get('ResultList', []):
+                if item['Languages']:
+                    languages[start + item['Index']] = item['Languages'][0]['LanguageCode']
+            for error in response.get('ErrorList', []):
+                logger.warning("Language detection failed for document %s: %s", start + error['Index'], error.get('ErrorMessage'))
+        return languages
+    
+    def analyze_sentiment_batch(self, texts: List[str], language_code: str = 'en') -> List[Dict[str, Any]]:
+        """
+        Analyze sentiment of several texts with batched Comprehend calls.
+        
+        Args:
+            texts: Texts to analyze, all in the same language
+            language_code: Language code for analysis
+            
+        Returns:
+            Sentiment analysis result for each text, in input order
+        """
+        results: List[Optional[Dict[str, Any]]] = [
+            self._local_sentiment(text, language_code) or self._sentiment_cache.get((language_code, text))
+            for text in texts
+        ]
+        # Positions of the texts that still need Comprehend
+        remote = [index for index, result in enumerate(results) if result is None]
+        for start in range(0, len(remote), _COMPREHEND_BATCH_SIZE):
+            positions = remote[start:start + _COMPREHEND_BATCH_SIZE]
+            chunk = [texts[index] for index in positions]
+            if self.comprehend_breaker.is_open:
+                logger.warning("Comprehend circuit open, skipping batch sentiment analysis")
+                break
+            try:
+                response = self.comprehend.batch_detect_sentiment(
+                    TextList=[_fit_comprehend_text(text) for text in chunk],
+                    LanguageCode=language_code
+                )
+            except Exception as e:
+                self._record_comprehend_failure(e)
+                logger.error("Batch sentiment analysis failed: %s", e)
+                continue
+            self.comprehend_breaker.record_success()
+            for item in response.get('ResultList', []):
+                index = positions[item['Index']]
+                results[index] = {
+                    'Sentiment': item['Sentiment'],
+                    'SentimentScore': item['SentimentScore']
                 }
-            }
+                self._sentiment_cache.put((language_code, texts[index]), results[index])
+            for error in response.get('ErrorList', []):
+                logger.error("Sentiment analysis failed for document %s: %s",
+                             positions[error['Index']], error.get('ErrorMessage'))
+        return [result if result is not None else self._neutral_sentiment() for result in results]
     
     def map_sentiment_to_emotion(self, sentiment: str, scores: Dict[str, float]) -> Dict[str, Any]:
         """
@@ -166,21 +1127,27 @@ class StateAgent:
         Returns:
             Emotion mapping with valence, arousal, and confidence
         """
-        emotion_data = self.emotion_mapping.get(sentiment, self.emotion_mapping['NEUTRAL'])
+        entry = _EMOTION_ENTRIES.get(sentiment) or _EMOTION_ENTRIES['NEUTRAL']
         
-        # Calculate confidence as the maximum score
-        confidence = max(scores.values())
+        # Calculate confidence as the maximum of Comprehend's four scores,
+        # unrolled since the keys are fixed (cheaper than a max() call)
+        positive, negative, neutral, mixed = (
+            scores['Positive'], scores['Negative'], scores['Neutral'], scores['Mixed']
+        )
+        confidence = positive if positive > negative else negative
+        confidence = confidence if confidence > neutral else neutral
+        confidence = confidence if confidence > mixed else mixed
         
         # Adjust valence and arousal based on confidence
-        valence = emotion_data['valence'] * confidence
-        arousal = emotion_data['arousal'] * confidence
+        valence = entry.valence * confidence
+        arousal = entry.arousal * confidence
         
         return {
-            'emotion': emotion_data['emotion'],
+            'emotion': entry.emotion,
             'valence': round(valence, 2),
             'arousal': round(arousal, 2),
             'confidence': round(confidence, 2),
-            'response_template': emotion_data['response_template']
+            'response_template': entry.response_template
         }
     
     def _calculate_emotional_intensity(self, emotion_data: Dict[str, Any]) -> str:
@@ -193,21 +1160,11 @@ class StateAgent:
         Returns:
             String describing emotional intensity
         """
-        confidence = emotion_data.get('confidence', 0.5)
-        valence = abs(emotion_data.get('valence', 0.0))
-        arousal = emotion_data.get('arousal', 0.0)
-        
-        # Calculate intensity based on confidence, valence magnitude, and arousal
-        intensity_score = (confidence * 0.4) + (valence * 0.3) + (arousal * 0.3)
-        
-        if intensity_score > 0.7:
-            return "Very High"
-        elif intensity_score > 0.5:
-            return "High"
-        elif intensity_score > 0.3:
-            return "Moderate"
-        else:
-            return "Low"
+        return _emotional_intensity(
+            emotion_data.get('confidence', 0.5),
+            emotion_data.get('valence', 0.0),
+            emotion_data.get('arousal', 0.0)
+        )
     
     def _determine_response_strategy(self, emotion_data: Dict[str, Any]) -> str:
         """
@@ -224,64 +1181,11 @@ class StateAgent:
         Returns:
             String describing response strategy
         """
-        valence = emotion_data.get('valence', 0.0)
-        arousal = emotion_data.get('arousal', 0.0)
-        confidence = emotion_data.get('confidence', 0.5)
-        
-        # Enhanced strategy determination with more granular emotional states
-        
-        # HIGH CONFIDENCE EMOTIONAL STATES (confidence > 0.7)
-        if confidence > 0.7:
-            # Very Positive and Energetic (Valence: 0.6 to 1, Arousal: 0.6 to 1)
-            if 0.6 <= valence <= 1 and 0.6 <= arousal <= 1:
-                return "HIGHLY_EXCITED_DETAILED_EXPLORATION"
-            
-            # Very Negative and Stressed (Valence: -1 to -0.6, Arousal: 0.6 to 1)
-            elif -1 <= valence <= -0.6 and 0.6 <= arousal <= 1:
-                return "HIGHLY_STRESSED_URGENT_SUPPORT"
-            
-            # Very Negative and Low Energy (Valence: -1 to -0.6, Arousal: 0 to 0.4)
-            elif -1 <= valence <= -0.6 and 0 <= arousal <= 0.4:
-                return "HIGHLY_DEPRESSED_GENTLE_SUPPORT"
-            
-            # Very Positive and Calm (Valence: 0.6 to 1, Arousal: 0 to 0.4)
-            elif 0.6 <= valence <= 1 and 0 <= arousal <= 0.4:
-                return "HIGHLY_CONTENT_DEEP_CONVERSATION"
-        
-        # MODERATE CONFIDENCE EMOTIONAL STATES (confidence 0.4 to 0.7)
-        elif confidence > 0.4:
-            # Positive and Energetic (Valence: 0.2 to 0.8, Arousal: 0.5 to 0.9)
-            if 0.2 <= valence <= 0.8 and 0.5 <= arousal <= 0.9:
-                return "EXCITED_DETAILED_SEARCH"
-            
-            # Negative and Stressed (Valence: -0.8 to -0.2, Arousal: 0.5 to 0.9)
-            elif -0.8 <= valence <= -0.2 and 0.5 <= arousal <= 0.9:
-                return "STRESSED_URGENT_CLEAR"
-            
-            # Negative and Low Energy (Valence: -0.8 to -0.2, Arousal: 0.1 to 0.5)
-            elif -0.8 <= valence <= -0.2 and 0.1 <= arousal <= 0.5:
-                return "BORED_SIMPLE_CLEAR"
-            
-            # Positive and Calm (Valence: 0.2 to 0.8, Arousal: 0.1 to 0.5)
-            elif 0.2 <= valence <= 0.8 and 0.1 <= arousal <= 0.5:
-                return "CALM_ENGAGING_CONVERSATION"
-        
-        # LOW CONFIDENCE OR NEUTRAL STATES (confidence <= 0.4)
-        else:
-            # Neutral with high arousal (Valence: -0.2 to 0.2, Arousal: 0.6 to 1)
-            if -0.2 <= valence <= 0.2 and 0.6 <= arousal <= 1:
-                return "UNCERTAIN_BUT_ENERGETIC_EXPLORATION"
-            
-            # Neutral with low arousal (Valence: -0.2 to 0.2, Arousal: 0 to 0.4)
-            elif -0.2 <= valence <= 0.2 and 0 <= arousal <= 0.4:
-                return "UNCERTAIN_CALM_GUIDANCE"
-            
-            # Mixed emotions (any valence, moderate arousal)
-            else:
-                return "MIXED_EMOTIONS_ADAPTIVE_SUPPORT"
-        
-        # Fallback for edge cases
-        return "ADAPTIVE_CONTEXTUAL"
+        return _response_strategy(
+            emotion_data.get('valence', 0.0),
+            emotion_data.get('arousal', 0.0),
+            emotion_data.get('confidence', 0.5)
+        )
     
     def _detect_feedback_and_adjust_strategy(self, text: str, emotion_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -294,15 +1198,7 @@ class StateAgent:
         Returns:
             Adjusted emotion data with feedback handling
         """
-        feedback_indicators = [
-            "didn't like", "don't like", "hate", "terrible", "awful", "bad",
-            "make it shorter", "make it better", "too long", "too short",
-            "not helpful", "useless", "waste of time", "stupid",
-            "give me", "I want", "I need", "show me", "tell me"
-        ]
-        
-        text_lower = text.lower()
-        is_feedback = any(indicator in text_lower for indicator in feedback_indicators)
+        is_feedback = _FEEDBACK_RE.search(text.lower()) is not None
         
         if is_feedback:
             # Adjust strategy to be more direct and helpful
@@ -328,37 +1224,11 @@ class StateAgent:
         Returns:
             Temperature value (0.0 to 1.0)
         """
-        arousal = emotion_data.get('arousal', 0.0)
-        valence = emotion_data.get('valence', 0.0)
-        confidence = emotion_data.get('confidence', 0.5)
-        
-        # Base temperature - more dynamic based on emotional state
-        base_temp = 0.5
-        
-        # Arousal-based adjustment (higher arousal = more creative/energetic)
-        # Scale: 0.0 to 0.4 adjustment based on arousal
-        arousal_adjustment = arousal * 0.4
-        
-        # Valence-based adjustment (extreme emotions = more creative)
-        # Scale: 0.0 to 0.3 adjustment based on valence magnitude
-        valence_adjustment = abs(valence) * 0.3
-        
-        # Confidence-based adjustment (higher confidence = more focused, lower = more exploratory)
-        # Scale: -0.2 to 0.2 adjustment based on confidence
-        confidence_adjustment = (confidence - 0.5) * 0.4
-        
-        # Emotional intensity bonus (very high or very low emotions get more creative)
-        emotional_intensity = abs(valence) + arousal
-        intensity_bonus = 0.0
-        if emotional_intensity > 1.2:  # Very intense emotions
-            intensity_bonus = 0.1
-        elif emotional_intensity < 0.3:  # Very calm emotions
-            intensity_bonus = -0.1
-        
-        temperature = base_temp + arousal_adjustment + valence_adjustment + confidence_adjustment + intensity_bonus
-        
-        # Clamp between 0.2 and 0.95 for more dynamic range
-        return max(0.2, min(0.95, temperature))
+        return _response_temperature(
+            emotion_data.get('arousal', 0.0),
+            emotion_data.get('valence', 0.0),
+            emotion_data.get('confidence', 0.5)
+        )
 
     def generate_adaptive_response(self, emotion_data: Dict[str, Any], 
                                  context: Optional[str] = None) -> str:
@@ -415,17 +1285,30 @@ class StateAgent:
             context_parts.append(f"AVERAGE AROUSAL: {emotional_context['avg_arousal']:.2f}")
             context_parts.append("")
         
-        # Add recent conversation context
-        context_parts.append("RECENT CONVERSATION HISTORY:")
-        for i, exchange in enumerate(context_exchanges):
+        # Add recent conversation context, newest exchanges first until the
+        # byte budget is spent, with each message shortened to a snippet
+        exchange_blocks = []
+        context_bytes = 0
+        for exchange in reversed(context_exchanges):
             if 'user' in exchange and 'assistant' in exchange:
-                context_parts.append(f"Exchange {i+1}:")
-                context_parts.append(f"  User: {exchange['user']}")
-                context_parts.append(f"  Assistant: {exchange['assistant']}")
+                block = [
+                    f"  User: {_context_snippet(exchange['user'])}",
+                    f"  Assistant: {_context_snippet(exchange['assistant'])}"
+                ]
                 # Add emotional context if available
                 if 'emotion' in exchange:
-                    context_parts.append(f"  [Emotional Context: {exchange['emotion']}]")
-                context_parts.append("")
+                    block.append(f"  [Emotional Context: {exchange['emotion']}]")
+                block_bytes = sum(len(line.encode('utf-8')) + 1 for line in block)
+                if exchange_blocks and context_bytes + block_bytes > _MAX_CONTEXT_BYTES:
+                    break
+                exchange_blocks.append(block)
+                context_bytes += block_bytes
+        
+        context_parts.append("RECENT CONVERSATION HISTORY:")
+        for i, block in enumerate(reversed(exchange_blocks)):
+            context_parts.append(f"Exchange {i+1}:")
+            context_parts.extend(block)
+            context_parts.append("")
         
         if context_parts:
             context_string = "\n".join(context_parts)
@@ -448,28 +1331,17 @@ class StateAgent:
         if not conversation_history or len(conversation_history) == 0:
             return None
         
-        # Extract emotional data from conversation history
-        emotional_data = []
-        for exchange in conversation_history:
-            if 'emotion' in exchange and 'valence' in exchange and 'arousal' in exchange:
-                emotional_data.append({
-                    'emotion': exchange['emotion'],
-                    'valence': exchange.get('valence', 0.0),
-                    'arousal': exchange.get('arousal', 0.0),
-                    'confidence': exchange.get('confidence', 0.5)
-                })
-        
-        if not emotional_data:
+        stats = self._get_conversation_stats(conversation_history)
+        count = stats.count
+        if not count:
             return None
+        # Context enhancement, emotion data and the prompt all ask for the same turn's patterns
+        if stats.patterns is not None:
+            return stats.patterns
         
-        # Calculate patterns
-        valences = [item['valence'] for item in emotional_data]
-        arousals = [item['arousal'] for item in emotional_data]
-        confidences = [item['confidence'] for item in emotional_data]
-        
-        avg_valence = sum(valences) / len(valences)
-        avg_arousal = sum(arousals) / len(arousals)
-        avg_confidence = sum(confidences) / len(confidences)
+        avg_valence = stats.mean(stats.valence_prefix, 0, count)
+        avg_arousal = stats.mean(stats.arousal_prefix, 0, count)
+        avg_confidence = stats.mean(stats.confidence_prefix, 0, count)
         
         # Determine emotional pattern
         if avg_valence > 0.3 and avg_arousal > 0.5:
@@ -484,10 +1356,10 @@ class StateAgent:
             pattern = "Mixed Emotional States"
         
         # Determine trend (comparing first half vs second half)
-        if len(emotional_data) >= 4:
-            mid_point = len(emotional_data) // 2
-            first_half_valence = sum(valences[:mid_point]) / mid_point
-            second_half_valence = sum(valences[mid_point:]) / (len(valences) - mid_point)
+        if count >= 4:
+            mid_point = count // 2
+            first_half_valence = stats.mean(stats.valence_prefix, 0, mid_point)
+            second_half_valence = stats.mean(stats.valence_prefix, mid_point, count)
             
             if second_half_valence > first_half_valence + 0.2:
                 trend = "Improving Emotional State"
@@ -498,14 +1370,95 @@ class StateAgent:
         else:
             trend = "Insufficient Data for Trend Analysis"
         
-        return {
-            'pattern': pattern,
-            'trend': trend,
-            'avg_valence': avg_valence,
-            'avg_arousal': avg_arousal,
-            'avg_confidence': avg_confidence,
-            'total_exchanges': len(emotional_data)
-        }
+        stats.patterns = {
+            'pattern': pattern,
+            'trend': trend,
+            'avg_valence': avg_valence,
+            'avg_arousal': avg_arousal,
+            'avg_confidence': avg_confidence,
+            'total_exchanges': count
+        }
+        return stats.patterns
+    
+    def _get_conversation_stats(self, conversation_history: List[Dict]) -> ConversationStats:
+        """
+        Get up-to-date emotional stats for a conversation history.
+        
+        Stats from an earlier turn of the same conversation are extended with
+        just the new exchanges; they are rebuilt when the history does not
+        continue them (e.g. the client trimmed or edited it).
+        
+        Args:
+            conversation_history: Non-empty conversation history
+            
+        Returns:
+            Stats covering the whole history
+        """
+        key = _conversation_key(conversation_history)
+        with self._conversation_stats_lock:
+            stats = self._conversation_stats.get(key)
+            if stats is None or not stats.continues(conversation_history):
+                stats = ConversationStats()
+                self._conversation_stats.put(key, stats)
+            stats.extend(conversation_history)
+        return stats
+    
+    def _summarize_history(self, conversation_history: List[Dict]) -> Optional[str]:
+        """
+        Summarize the exchanges older than the last two, incrementally.
+        
+        The summary from an earlier turn of the same conversation is extended
+        with only the exchanges that have since left the verbatim window, so
+        each turn costs at most one short ChatGPT call.
+        
+        Args:
+            conversation_history: Conversation history sent with the current turn
+            
+        Returns:
+            Summary of the older exchanges, or None if there are none or
+            ChatGPT is unavailable
+        """
+        older = conversation_history[:-_RECENT_EXCHANGES]
+        if not older or not self.openai_client:
+            return None
+        
+        key = _conversation_key(conversation_history)
+        cached = self._history_summaries.get(key)
+        summary = None
+        new_exchanges = older
+        if cached is not None:
+            covered, last_exchange, cached_summary = cached
+            if covered <= len(older) and older[covered - 1] == last_exchange:
+                summary = cached_summary
+                new_exchanges = older[covered:]
+        if summary is not None and not new_exchanges:
+            return summary
+        
+        transcript = "\n".join(
+            f"User: {exchange.get('user', '')}\nAssistant: {exchange.get('assistant', '')}"
+            for exchange in new_exchanges
+        )
+        if summary:
+            transcript = f"Summary so far: {summary}\n\nNew exchanges:\n{transcript}"
+        try:
+            summary = self._cached_chat_completion(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Summarize this conversation in one short paragraph. Keep what the user wants, any problems they raised, and how their mood has changed."
+                    },
+                    {"role": "user", "content": transcript}
+                ],
+                max_tokens=100,
+                temperature=0.3
+            ).strip()
+        except Exception as e:
+            logger.error("Error summarizing conversation history: %s", e)
+            return None
+        
+        self._history_summaries.put(key, (len(older), older[-1], summary))
+        return summary
     
     def rephrase_with_chatgpt(self, text: str) -> str:
         """
@@ -520,27 +1473,25 @@ class StateAgent:
         if not self.openai_client:
             return text  # Return original if ChatGPT not available
         
+        rephrased_text = self._rephrase_cache.get(text)
+        if rephrased_text is not None:
+            return rephrased_text
+        
+        embedding = None
+        if self._rephrase_clusters is not None:
+            embedding = self._embed_text(text)
+            if embedding is not None:
+                rephrased_text = self._rephrase_clusters.get(embedding)
+                if rephrased_text is not None:
+                    return rephrased_text
+        
         try:
-            response = self.openai_client.chat.completions.create(
+            response = self._create_chat_completion(
                 model="gpt-3.5-turbo",
                 messages=[
                     {
                         "role": "system",
-                        "content": """You are an expert in emotional intelligence and text analysis. Your task is to enhance user input to make their emotional state more explicit and analyzable while preserving their original meaning and intent.
-
-ENHANCEMENT GUIDELINES:
-1. **Preserve Original Meaning**: Keep the core message intact
-2. **Clarify Emotional Context**: Make implicit emotions more explicit
-3. **Maintain Authenticity**: Don't add emotions that aren't implied
-4. **Improve Clarity**: Make the emotional undertones clearer
-5. **Keep Natural**: Ensure the enhanced text sounds natural
-
-EXAMPLES:
-- "I'm tired" → "I'm feeling exhausted and drained"
-- "Work is hard" → "I'm feeling overwhelmed and stressed about work"
-- "I'm excited!" → "I'm feeling enthusiastic and excited about this opportunity"
-
-Focus on making the emotional content more analyzable while keeping it authentic."""
+                        "content": _REPHRASE_SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
@@ -550,17 +1501,70 @@ Focus on making the emotional content more analyzable while keeping it authentic
                 max_tokens=200,
                 temperature=0.4
             )
-            return response.choices[0].message.content.strip()
+            rephrased_text = response.choices[0].message.content.strip()
+            self._rephrase_cache.put(text, rephrased_text)
+            if embedding is not None:
+                self._rephrase_clusters.put(embedding, rephrased_text)
+            return rephrased_text
         except Exception as e:
-            logger.error(f"Error enhancing text with ChatGPT: {e}")
+            logger.error("Error enhancing text with ChatGPT: %s", e)
             # Return original text with basic enhancement if ChatGPT fails
             return f"I'm feeling {text.lower()}" if not any(word in text.lower() for word in ['feeling', 'feel', 'emotion', 'emotional']) else text
     
-    def generate_conversational_response_with_chatgpt(self, emotion_data: Dict[str, Any], 
-                                                     original_text: str, 
-                                                     conversation_history: Optional[List[Dict]] = None) -> str:
+    def rephrase_batch_with_chatgpt(self, texts: List[str]) -> List[str]:
         """
-        Use ChatGPT to generate conversational responses that are heavily dependent on Comprehend emotional analysis.
+        Rephrase several independent texts with a single ChatGPT call.
+        
+        Texts already in the rephrase cache are not resent. The rest are sent
+        as one numbered list, so the shared system prompt is paid for once
+        instead of once per text.
+        
+        Args:
+            texts: Original user inputs
+            
+        Returns:
+            Enhanced text for each input, in input order; the original text
+            for any input ChatGPT did not return
+        """
+        rephrased_texts = [self._rephrase_cache.get(text) for text in texts]
+        missing = [index for index, rephrased_text in enumerate(rephrased_texts) if rephrased_text is None]
+        if not missing or not self.openai_client:
+            return [rephrased_text or text for rephrased_text, text in zip(rephrased_texts, texts)]
+        if len(missing) == 1:
+            rephrased_texts[missing[0]] = self.rephrase_with_chatgpt(texts[missing[0]])
+            return rephrased_texts
+        
+        numbered = '\n'.join(f"{number}. {' '.join(texts[index].split())}"
+                             for number, index in enumerate(missing, 1))
+        try:
+            response = self._create_chat_completion(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": _REPHRASE_SYSTEM_PROMPT + _BATCH_REPHRASE_INSTRUCTIONS},
+                    {
+                        "role": "user",
+                        "content": f"Enhance these texts for better emotion analysis while keeping them authentic:\n{numbered}"
+                    }
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=200 * len(missing),
+                temperature=0.4
+            )
+            for item in json.loads(response.choices[0].message.content)['results']:
+                number = int(item['index'])
+                if 1 <= number <= len(missing) and item.get('rephrased'):
+                    index = missing[number - 1]
+                    rephrased_texts[index] = item['rephrased'].strip()
+                    self._rephrase_cache.put(texts[index], rephrased_texts[index])
+        except Exception as e:
+            logger.error("Error rephrasing batch with ChatGPT: %s", e)
+        
+        return [rephrased_text or text for rephrased_text, text in zip(rephrased_texts, texts)]
+    
+    def _build_conversation_prompts(self, emotion_data: Dict[str, Any], original_text: str,
+                                    conversation_history: Optional[List[Dict]] = None) -> Tuple[str, str]:
+        """
+        Build the ChatGPT system and user prompts for a conversational response.
         
         Args:
             emotion_data: Emotion analysis results from Comprehend
@@ -568,30 +1572,33 @@ Focus on making the emotional content more analyzable while keeping it authentic
             conversation_history: Previous conversation context
             
         Returns:
-            Emotionally-aware conversational response
+            Tuple of (system prompt, user prompt)
         """
-        if not self.openai_client:
-            return self.generate_adaptive_response(emotion_data)  # Fallback to original method
-        
-        try:
-            emotion = emotion_data.get('emotion', 'Unknown')
-            sentiment = emotion_data.get('sentiment', 'NEUTRAL')
-            confidence = emotion_data.get('confidence', 0.5)
-            valence = emotion_data.get('valence', 0.0)
-            arousal = emotion_data.get('arousal', 0.0)
-            sentiment_scores = emotion_data.get('sentiment_scores', {})
-            
-            # Determine emotional intensity and response strategy
-            emotional_intensity = self._calculate_emotional_intensity(emotion_data)
-            response_strategy = self._determine_response_strategy(emotion_data)
-            
-            # Check if feedback was detected and adjust strategy
-            if emotion_data.get('feedback_detected', False):
-                response_strategy = "FEEDBACK_PROBLEM_SOLVING"
-                emotional_intensity = "High"  # More assertive for feedback
-            
-            # Create fine-tuned system prompt based on valence and arousal ranges
-            system_prompt = f"""You are an emotionally intelligent AI assistant whose responses are PRIMARILY driven by the user's emotional state detected by Amazon Comprehend. Your response style, tone, and content must adapt based on their emotional analysis.
+        emotion = emotion_data.get('emotion', 'Unknown')
+        sentiment = emotion_data.get('sentiment', 'NEUTRAL')
+        confidence = emotion_data.get('confidence', 0.5)
+        valence = emotion_data.get('valence', 0.0)
+        arousal = emotion_data.get('arousal', 0.0)
+        sentiment_scores = emotion_data.get('sentiment_scores', {})
+        
+        # Determine emotional intensity and response strategy
+        emotional_intensity = self._calculate_emotional_intensity(emotion_data)
+        response_strategy = self._determine_response_strategy(emotion_data)
+        
+        # Check if feedback was detected and adjust strategy
+        if emotion_data.get('feedback_detected', False):
+            response_strategy = "FEEDBACK_PROBLEM_SOLVING"
+            emotional_intensity = "High"  # More assertive for feedback
+        
+        # Append this turn's analysis to the static prompt, keeping the shared prefix stable.
+        # The compact prompt carries only the selected strategy's instructions.
+        strategy_prompt = _STRATEGY_PROMPTS.get(response_strategy)
+        if self.compact_system_prompt and strategy_prompt is not None:
+            static_prompt = (_CONVERSATION_PROMPT_INTRO + "\n\nRESPONSE STRATEGY:\n\n"
+                             + strategy_prompt + "\n\n" + _CONVERSATION_PROMPT_RULES)
+        else:
+            static_prompt = _CONVERSATION_SYSTEM_PROMPT
+        system_prompt = static_prompt + f"""
 
 CURRENT EMOTIONAL ANALYSIS (CRITICAL - USE THIS TO SHAPE YOUR RESPONSE):
 - Sentiment: {sentiment} (confidence: {confidence:.2f})
@@ -606,165 +1613,40 @@ SENTIMENT BREAKDOWN:
 - Neutral: {sentiment_scores.get('Neutral', 0):.2f}
 - Mixed: {sentiment_scores.get('Mixed', 0):.2f}
 
-ENHANCED RESPONSE STRATEGIES BASED ON VALENCE AND AROUSAL:
-
-**STRATEGY: {response_strategy}**
-
-1. **HIGHLY_EXCITED_DETAILED_EXPLORATION** (Valence: 0.6-1, Arousal: 0.6-1):
-   - User is HIGHLY ENTHUSIASTIC and seeking COMPREHENSIVE, DETAILED answers
-   - Provide EXTENSIVE, well-researched responses with multiple examples
-   - Include data, statistics, and supporting evidence
-   - Use VERY ENTHUSIASTIC language that matches their high energy
-   - Ask multiple follow-up questions to explore topics deeply
-   - Provide comprehensive explanations with multiple perspectives
-   - Match their excitement level
-
-2. **HIGHLY_STRESSED_URGENT_SUPPORT** (Valence: -1 to -0.6, Arousal: 0.6-1):
-   - User is HIGHLY DISTRESSED and needs IMMEDIATE, CRITICAL support
-   - Keep responses EXTREMELY SHORT and DIRECT
-   - Provide immediate, actionable solutions
-   - Use calm, reassuring language
-   - Focus on urgent, practical help
-   - Avoid any unnecessary details or tangents
-   - Be supportive and understanding
-
-3. **HIGHLY_DEPRESSED_GENTLE_SUPPORT** (Valence: -1 to -0.6, Arousal: 0-0.4):
-   - User is HIGHLY DEPRESSED and needs GENTLE, COMPASSIONATE support
-   - Use warm, gentle, and encouraging language
-   - Provide simple, positive reinforcement
-   - Avoid overwhelming them with information
-   - Focus on small, achievable steps
-   - Be patient and understanding
-   - Offer emotional support and validation
-
-4. **HIGHLY_CONTENT_DEEP_CONVERSATION** (Valence: 0.6-1, Arousal: 0-0.4):
-   - User is HIGHLY CONTENT and seeking MEANINGFUL, DEEP conversation
-   - Engage in thoughtful, philosophical discussions
-   - Ask profound, reflective questions
-   - Share insights and personal experiences
-   - Create a warm, intimate conversational tone
-   - Encourage deep thinking and self-reflection
-   - Build on their positive emotional state
-
-5. **EXCITED_DETAILED_SEARCH** (Valence: 0.2-0.8, Arousal: 0.5-0.9):
-   - User is seeking DETAILED, COMPREHENSIVE answers
-   - Provide thorough, well-researched responses with supporting evidence
-   - Include specific examples, data, and backing information
-   - Use engaging, enthusiastic language that matches their energy
-   - Ask follow-up questions to dive deeper into topics
-   - Provide multiple perspectives and detailed explanations
-
-6. **STRESSED_URGENT_CLEAR** (Valence: -0.8 to -0.2, Arousal: 0.5-0.9):
-   - User needs URGENT, CLEAR, TO-THE-POINT answers
-   - Keep responses SHORT and DIRECT - no rambling or unnecessary details
-   - Provide immediate, actionable solutions
-   - Use clear, concise language
-   - Focus on practical, urgent help
-   - Avoid lengthy explanations or tangents
-
-7. **BORED_SIMPLE_CLEAR** (Valence: -0.8 to -0.2, Arousal: 0.1-0.5):
-   - User needs SIMPLE, CLEAR answers
-   - Use straightforward, easy-to-understand language
-   - Keep responses concise but complete
-   - Avoid complex jargon or lengthy explanations
-   - Make information digestible and engaging
-   - Use simple, direct communication
-
-8. **CALM_ENGAGING_CONVERSATION** (Valence: 0.2-0.8, Arousal: 0.1-0.5):
-   - User needs ENGAGING, TWO-WAY conversation
-   - Ask thoughtful questions to encourage dialogue
-   - Share personal insights and experiences
-   - Create a conversational, friendly tone
-   - Encourage back-and-forth discussion
-   - Make the interaction feel like a natural conversation
-
-9. **UNCERTAIN_BUT_ENERGETIC_EXPLORATION** (Valence: -0.2-0.2, Arousal: 0.6-1):
-   - User is uncertain but energetic - needs GUIDANCE and DIRECTION
-   - Provide clear, structured information
-   - Help them explore options and possibilities
-   - Use encouraging, supportive language
-   - Offer multiple approaches to their question
-   - Help them clarify their needs
-
-10. **UNCERTAIN_CALM_GUIDANCE** (Valence: -0.2-0.2, Arousal: 0-0.4):
-    - User is uncertain and calm - needs GENTLE GUIDANCE
-    - Provide clear, simple explanations
-    - Use patient, understanding language
-    - Offer step-by-step guidance
-    - Help them build confidence
-    - Be supportive and encouraging
-
-11. **MIXED_EMOTIONS_ADAPTIVE_SUPPORT** (Any valence, moderate arousal):
-    - User has mixed emotions - needs ADAPTIVE, FLEXIBLE support
-    - Acknowledge the complexity of their situation
-    - Provide balanced, nuanced responses
-    - Use empathetic, understanding language
-    - Help them sort through their feelings
-    - Be patient and non-judgmental
-
-12. **FEEDBACK_PROBLEM_SOLVING** (User gave negative feedback):
-    - User is frustrated with previous response - needs IMMEDIATE BETTER ANSWER
-    - DO NOT apologize or be defensive
-    - IMMEDIATELY provide what they asked for
-    - Be DIRECT and ACTIONABLE
-    - Focus on SOLVING their problem, not explaining
-    - Give them exactly what they need, better than before
-    - Ask SPECIFIC follow-up questions to get better information
-    - Be HELPFUL, not apologetic
-
-CRITICAL RULES:
-- Your response MUST match the specific strategy for their emotional state
-- Adjust your response length and complexity based on their arousal level
-- Match their energy level (high arousal = energetic, low arousal = calm)
-- Provide the type of answer they're seeking based on their emotional state
-- Use emotional intelligence in every interaction WITHOUT explicitly mentioning their mood
-- Respond naturally and conversationally
-- PRIORITIZE their emotional state over generic responses
-- When users give feedback (like "make it shorter" or "I didn't like that"), IMMEDIATELY provide a better response
-- Focus on SOLVING their problem, not apologizing
-- Be ACTIONABLE and HELPFUL, not defensive
-- Ask SPECIFIC follow-up questions to get better information
-- Provide CONCRETE, USEFUL information they can actually use
-
-AVOID:
-- Generic responses that ignore emotional context
-- Being emotionally tone-deaf to their state
-- Overwhelming someone who's already distressed
-- Being dismissive of their feelings
-- Providing the wrong type of response for their emotional state
-- Explicitly mentioning their detected mood or emotional state
-- Clinical or analytical language about their emotions
-- Defensive responses when users give feedback
-- Vague "I'm sorry" responses that don't solve the problem
-- Asking "How can I help?" without providing actual help first
-- Wasting time with apologies instead of better answers"""
-            
-            # Create emotionally-aware user prompt with comprehensive conversation context
-            history_context = ""
-            emotional_trend_context = ""
-            
-            if conversation_history:
+**STRATEGY: {response_strategy}**"""
+        
+        # Create emotionally-aware user prompt with comprehensive conversation context
+        history_context = ""
+        emotional_trend_context = ""
+        
+        if conversation_history:
+            summary = self._summarize_history(conversation_history) if self.summarize_history else None
+            if summary:
+                # Older exchanges are carried by the running summary
+                recent_history = conversation_history[-_RECENT_EXCHANGES:]
+                history_context = f"\n\nEARLIER CONVERSATION SUMMARY:\n{summary}\n\nRECENT CONVERSATION CONTEXT:\n"
+            else:
                 # Get more comprehensive conversation history (up to 5 exchanges)
                 recent_history = conversation_history[-5:] if len(conversation_history) > 5 else conversation_history
                 
                 # Build detailed conversation context
                 history_context = f"\n\nCOMPREHENSIVE CONVERSATION CONTEXT:\n"
-                for i, exchange in enumerate(recent_history):
-                    history_context += f"Exchange {i+1}:\n"
-                    history_context += f"  User: {exchange.get('user', '')}\n"
-                    history_context += f"  Assistant: {exchange.get('assistant', '')}\n"
-                    
-                    # Add emotional context if available
-                    if 'emotion' in exchange:
-                        history_context += f"  [Previous Emotional State: {exchange.get('emotion', 'Unknown')}]\n"
-                    if 'valence' in exchange and 'arousal' in exchange:
-                        history_context += f"  [Previous Valence: {exchange.get('valence', 0):.2f}, Arousal: {exchange.get('arousal', 0):.2f}]\n"
-                    history_context += "\n"
+            for i, exchange in enumerate(recent_history):
+                history_context += f"Exchange {i+1}:\n"
+                history_context += f"  User: {exchange.get('user', '')}\n"
+                history_context += f"  Assistant: {exchange.get('assistant', '')}\n"
                 
-                # Analyze emotional trends from conversation history
-                emotional_trends = self._analyze_conversation_emotional_patterns(conversation_history)
-                if emotional_trends:
-                    emotional_trend_context = f"""
+                # Add emotional context if available
+                if 'emotion' in exchange:
+                    history_context += f"  [Previous Emotional State: {exchange.get('emotion', 'Unknown')}]\n"
+                if 'valence' in exchange and 'arousal' in exchange:
+                    history_context += f"  [Previous Valence: {exchange.get('valence', 0):.2f}, Arousal: {exchange.get('arousal', 0):.2f}]\n"
+                history_context += "\n"
+            
+            # Analyze emotional trends from conversation history
+            emotional_trends = self._analyze_conversation_emotional_patterns(conversation_history)
+            if emotional_trends:
+                emotional_trend_context = f"""
 EMOTIONAL TREND ANALYSIS:
 - Overall Pattern: {emotional_trends['pattern']}
 - Emotional Trend: {emotional_trends['trend']}
@@ -772,8 +1654,8 @@ EMOTIONAL TREND ANALYSIS:
 - Average Arousal: {emotional_trends['avg_arousal']:.2f}
 - Total Exchanges: {emotional_trends['total_exchanges']}
 """
-            
-            user_prompt = f"""User's message: "{original_text}"
+        
+        user_prompt = f"""User's message: "{original_text}"
 
 CURRENT EMOTIONAL ANALYSIS (CRITICAL - USE THIS TO SHAPE YOUR RESPONSE):
 - Sentiment: {sentiment} (confidence: {confidence:.2f})
@@ -793,32 +1675,222 @@ FEEDBACK HANDLING RULES:
 - Focus on ACTIONABLE solutions, not explanations
 
 Generate a natural, conversational response that is emotionally appropriate for their current state. Your response should feel like it's coming from someone who truly understands their situation and the emotional journey they've been on. DO NOT explicitly mention their mood or emotional state. Respond naturally and helpfully, taking into account both their current emotional state and the emotional patterns from our conversation history."""
+        
+        return system_prompt, user_prompt
+    
+    def generate_conversational_response_with_chatgpt(self, emotion_data: Dict[str, Any], 
+                                                     original_text: str, 
+                                                     conversation_history: Optional[List[Dict]] = None) -> str:
+        """
+        Use ChatGPT to generate conversational responses that are heavily dependent on Comprehend emotional analysis.
+        
+        Args:
+            emotion_data: Emotion analysis results from Comprehend
+            original_text: Original user input
+            conversation_history: Previous conversation context
+            
+        Returns:
+            Emotionally-aware conversational response
+        """
+        if not self.openai_client:
+            return self.generate_adaptive_response(emotion_data)  # Fallback to original method
+        
+        response_key = None
+        if self._response_cache is not None:
+            if emotion_data.get('feedback_detected', False):
+                response_strategy = "FEEDBACK_PROBLEM_SOLVING"
+            else:
+                response_strategy = self._determine_response_strategy(emotion_data)
+            response_key = (
+                _result_cache_key(original_text, conversation_history[-1:] if conversation_history else None),
+                emotion_data.get('emotion'),
+                response_strategy
+            )
+            response = self._response_cache.get(response_key)
+            if response is not None:
+                return response
+        
+        try:
+            system_prompt, user_prompt = self._build_conversation_prompts(
+                emotion_data, original_text, conversation_history
+            )
             
             # Adjust temperature based on emotional state
             temperature = self._calculate_response_temperature(emotion_data)
             
-            response = self.openai_client.chat.completions.create(
+            content = self._cached_chat_completion(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=300,
+                temperature=temperature
+            )
+            response = content.strip()
+            if response_key is not None:
+                self._response_cache.put(response_key, response)
+            return response
+        except Exception as e:
+            logger.error("Error generating intelligent response with ChatGPT: %s", e)
+            return self._fallback_response(emotion_data, conversation_history)
+    
+    def _create_chat_completion(self, **request: Any) -> Any:
+        """
+        Call chat.completions.create through the OpenAI circuit breaker.
+        
+        Args:
+            **request: Keyword arguments for chat.completions.create
+            
+        Returns:
+            The OpenAI response (or stream)
+            
+        Raises:
+            CircuitOpenError: If OpenAI has been failing and the circuit is open
+        """
+        if self.openai_breaker.is_open:
+            raise CircuitOpenError("OpenAI circuit open")
+        if self.openai_rate_limiter is not None:
+            self.openai_rate_limiter.acquire(_estimate_request_tokens(request))
+        try:
+            response = self.openai_client.chat.completions.create(**request)
+        except Exception:
+            self.openai_breaker.record_failure()
+            raise
+        self.openai_breaker.record_success()
+        return response
+    
+    def _cached_chat_completion(self, **request: Any) -> str:
+        """
+        Run a ChatGPT completion, reusing the reply to an identical earlier request.
+        
+        Args:
+            **request: Keyword arguments for chat.completions.create
+            
+        Returns:
+            Message content of the first choice
+        """
+        cache_key = hashlib.blake2b(
+            json.dumps(request, sort_keys=True).encode('utf-8'), digest_size=16
+        ).digest()
+        content = self._completion_cache.get(cache_key)
+        if content is None:
+            response = self._create_chat_completion(**request)
+            content = response.choices[0].message.content
+            self._completion_cache.put(cache_key, content)
+        return content
+    
+    def _fallback_response(self, emotion_data: Dict[str, Any],
+                           conversation_history: Optional[List[Dict]] = None) -> str:
+        """
+        Template response used when ChatGPT fails, with conversation context if available.
+        
+        Args:
+            emotion_data: Emotion analysis results
+            conversation_history: Previous conversation context
+            
+        Returns:
+            Fallback response string
+        """
+        # Enhanced fallback with conversation context
+        fallback_response = self.generate_adaptive_response(emotion_data)
+        
+        # Add conversation context to fallback if available
+        if conversation_history and len(conversation_history) > 0:
+            recent_context = conversation_history[-1].get('user', '') if conversation_history else ''
+            if recent_context:
+                fallback_response += f" I understand you mentioned '{recent_context[:50]}...' earlier."
+        
+        return fallback_response
+    
+    def stream_conversational_response_with_chatgpt(self, emotion_data: Dict[str, Any],
+                                                    original_text: str,
+                                                    conversation_history: Optional[List[Dict]] = None) -> Iterator[str]:
+        """
+        Stream the conversational response from ChatGPT as it is generated.
+        
+        Args:
+            emotion_data: Emotion analysis results from Comprehend
+            original_text: Original user input
+            conversation_history: Previous conversation context
+            
+        Yields:
+            Response text chunks in order
+        """
+        if not self.openai_client:
+            yield self.generate_adaptive_response(emotion_data)
+            return
+        
+        streamed_any = False
+        try:
+            system_prompt, user_prompt = self._build_conversation_prompts(
+                emotion_data, original_text, conversation_history
+            )
+            stream = self._create_chat_completion(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 max_tokens=300,
-                temperature=temperature
+                temperature=self._calculate_response_temperature(emotion_data),
+                stream=True
             )
-            return response.choices[0].message.content.strip()
+            try:
+                for chunk in stream:
+                    content = chunk.choices[0].delta.content if chunk.choices else None
+                    if content:
+                        streamed_any = True
+                        yield content
+            finally:
+                # Also runs when the consumer stops early (e.g. the client disconnected),
+                # so OpenAI stops generating tokens nobody will read
+                stream.response.close()
         except Exception as e:
-            logger.error(f"Error generating intelligent response with ChatGPT: {e}")
-            # Enhanced fallback with conversation context
-            fallback_response = self.generate_adaptive_response(emotion_data)
+            logger.error("Error streaming response with ChatGPT: %s", e)
+            # A partially streamed reply is kept as is; otherwise send the fallback
+            if not streamed_any:
+                yield self._fallback_response(emotion_data, conversation_history)
+
+    def rephrase_and_respond_with_chatgpt(self, emotion_data: Dict[str, Any], original_text: str,
+                                          conversation_history: Optional[List[Dict]] = None) -> Tuple[str, str]:
+        """
+        Rephrase the input and generate the conversational response in a single ChatGPT call.
+        
+        Args:
+            emotion_data: Emotion analysis results from Comprehend
+            original_text: Original user input
+            conversation_history: Previous conversation context
             
-            # Add conversation context to fallback if available
-            if conversation_history and len(conversation_history) > 0:
-                recent_context = conversation_history[-1].get('user', '') if conversation_history else ''
-                if recent_context:
-                    fallback_response += f" I understand you mentioned '{recent_context[:50]}...' earlier."
+        Returns:
+            Tuple of (rephrased text, conversational response)
+        """
+        if not self.openai_client:
+            return original_text, self.generate_adaptive_response(emotion_data)
+        
+        try:
+            system_prompt, user_prompt = self._build_conversation_prompts(
+                emotion_data, original_text, conversation_history
+            )
+            temperature = self._calculate_response_temperature(emotion_data)
             
-            return fallback_response
+            content = self._cached_chat_completion(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt + _SINGLE_PASS_INSTRUCTIONS},
+                    {"role": "user", "content": user_prompt}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=500,
+                temperature=temperature
+            )
+            payload = json.loads(content)
+            return payload['rephrased'].strip(), payload['response'].strip()
+        except Exception as e:
+            logger.error("Error generating combined rephrase and response with ChatGPT: %s", e)
+            return original_text, self.generate_conversational_response_with_chatgpt(
+                emotion_data, original_text, conversation_history
+            )
 
     def process_text(self, text: str, session_id: Optional[str] = None,
                     context: Optional[str] = None, conversation_history: Optional[List[Dict]] = None) -> Dict[str, Any]:
@@ -840,20 +1912,482 @@ Generate a natural, conversational response that is emotionally appropriate for
         if not cleaned_text:
             return {
                 'error': 'Empty or invalid input text',
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': _utc_timestamp()
             }
         
+        # Serve repeated inputs from the result cache, skipping every API call
+        cache_key = _result_cache_key(cleaned_text, conversation_history)
+        cached_result = self._get_cached_result(cache_key, text, cleaned_text, session_id)
+        if cached_result is not None:
+            return cached_result
+        
+        # Near-duplicates of earlier history-free inputs are served from the semantic cache
+        embedding = None
+        if self._semantic_cache is not None and not conversation_history:
+            embedding = self._embed_text(cleaned_text)
+            if embedding is not None:
+                similar_result = self._semantic_cache.get(embedding)
+                if similar_result is not None:
+                    return self._serve_cached_result(similar_result, text, cleaned_text, session_id)
+        
+        # While Comprehend is failing, answer from templates instead of spending
+        # ChatGPT calls on a fallback classification
+        if self.comprehend_breaker.is_open:
+            return self._degraded_result(text, cleaned_text, session_id)
+        
         # Enhanced text processing with comprehensive conversation context
         enhanced_text = self._enhance_text_with_context(cleaned_text, conversation_history)
         
-        # Rephrase with ChatGPT for better analysis (using enhanced text)
-        rephrased_text = self.rephrase_with_chatgpt(enhanced_text)
+        if self.single_pass_llm and self.openai_client:
+            # Comprehend scores the context-enhanced text directly; the rephrase is
+            # produced alongside the response by _complete_analysis
+            language, sentiment_result = self._detect_language_and_sentiment(cleaned_text, enhanced_text, session_id)
+            result = self._complete_analysis(text, cleaned_text, None, language,
+                                             sentiment_result, session_id, conversation_history)
+        else:
+            rephrased_text, language, sentiment_result = self._rephrase_and_classify(
+                cleaned_text, enhanced_text, session_id
+            )
+            result = self._complete_analysis(text, cleaned_text, rephrased_text, language,
+                                             sentiment_result, session_id, conversation_history)
+        
+        if not result.get('degraded'):
+            stored_result = EmotionResult.from_dict(result)
+            self._result_cache.put(cache_key, stored_result)
+            if embedding is not None:
+                self._semantic_cache.put(embedding, stored_result)
+        
+        return result
+    
+    def prewarm_connections(self, timeout: float = 5.0) -> None:
+        """
+        Open connections to OpenAI and Comprehend before the first request needs them.
+        
+        Each client makes one cheap call in parallel (listing models, and
+        detecting the language of a one-word text), so DNS resolution and the
+        TLS handshakes happen now and the pooled connections are reused later.
+        Failures are logged and otherwise ignored.
+        
+        Args:
+            timeout: Seconds to wait for the calls before giving up on them
+        """
+        calls = {'Comprehend': functools.partial(self.comprehend.detect_dominant_language, Text='warmup')}
+        if self.openai_client:
+            calls['OpenAI'] = self.openai_client.models.list
+        futures = {name: _IO_EXECUTOR.submit(call) for name, call in calls.items()}
+        deadline = time.monotonic() + timeout
+        for name, future in futures.items():
+            try:
+                future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                logger.warning("Prewarming %s connection timed out", name)
+            except Exception as e:
+                logger.warning("Prewarming %s connection failed: %s", name, e)
+    
+    def save_semantic_cache(self) -> None:
+        """Write the semantic cache to SEMANTIC_CACHE_PATH, if both are configured."""
+        if self._semantic_cache is None or not self.semantic_cache_path:
+            return
+        try:
+            self._semantic_cache.save(self.semantic_cache_path)
+            logger.info("Saved %d semantic cache entries", len(self._semantic_cache))
+        except Exception as e:
+            logger.warning("Could not save semantic cache to %s: %s", self.semantic_cache_path, e)
+    
+    def save_result_cache(self) -> None:
+        """Write the result cache to RESULT_CACHE_PATH, if configured."""
+        if not self.result_cache_path:
+            return
+        try:
+            self._result_cache.save(self.result_cache_path)
+            logger.info("Saved %d result cache entries", len(self._result_cache))
+        except Exception as e:
+            logger.warning("Could not save result cache to %s: %s", self.result_cache_path, e)
+    
+    def _embed_text(self, text: str) -> Optional[np.ndarray]:
+        """
+        Embed text with OpenAI for semantic cache lookups.
+        
+        Args:
+            text: Preprocessed input text
+            
+        Returns:
+            Embedding vector, or None if the request failed
+        """
+        if self.openai_breaker.is_open:
+            return None
+        try:
+            response = self.openai_client.embeddings.create(
+                model="text-embedding-3-small",
+                input=text
+            )
+        except Exception as e:
+            self.openai_breaker.record_failure()
+            logger.warning("Embedding request failed: %s", e)
+            return None
+        self.openai_breaker.record_success()
+        return np.asarray(response.data[0].embedding, dtype=np.float32)
+    
+    def _rephrase_and_classify(self, cleaned_text: str, enhanced_text: str,
+                               session_id: Optional[str] = None) -> Tuple[str, Optional[str], Dict[str, Any]]:
+        """
+        Rephrase the input with ChatGPT and run Comprehend on the result.
+        
+        Args:
+            cleaned_text: Preprocessed input text
+            enhanced_text: Input text with conversation context
+            session_id: Optional session identifier, for sticky language detection
+            
+        Returns:
+            Tuple of (rephrased text, detected language, sentiment result)
+        """
+        # Short or already explicit inputs go to Comprehend as they are
+        if not _needs_rephrase(cleaned_text):
+            language, sentiment_result = self._detect_language_and_sentiment(cleaned_text, enhanced_text, session_id)
+            return enhanced_text, language, sentiment_result
+        
+        if self.speculative_sentiment and self.openai_client:
+            return self._speculative_rephrase_and_classify(cleaned_text, enhanced_text, session_id)
         
-        # Detect language
-        language = self.detect_language(rephrased_text)
+        # Rephrase with ChatGPT for better analysis (using enhanced text).
+        # Language detection does not depend on the rephrase, so run it on the
+        # cleaned input while the ChatGPT call is in flight.
+        rephrase_future = _IO_EXECUTOR.submit(self.rephrase_with_chatgpt, enhanced_text)
+        language = self._detect_session_language(cleaned_text, session_id)
+        rephrased_text = rephrase_future.result()
         
         # Analyze sentiment using rephrased text
         sentiment_result = self.analyze_sentiment(rephrased_text, language or 'en')
+        self._check_language_streak(session_id, sentiment_result)
+        
+        return rephrased_text, language, sentiment_result
+    
+    def _detect_session_language(self, cleaned_text: str, session_id: Optional[str] = None) -> Optional[str]:
+        """
+        Detect the input language, reusing a session's language once it is stable.
+        
+        After _STICKY_LANGUAGE_STREAK consecutive detections of the same
+        language in a session, detection is skipped for later messages.
+        
+        Args:
+            cleaned_text: Preprocessed input text
+            session_id: Optional session identifier
+            
+        Returns:
+            Language code or None if detection fails
+        """
+        if not session_id:
+            return self.detect_language(cleaned_text)
+        
+        streak = self._language_streaks.get(session_id)
+        if streak is not None and streak[1] >= _STICKY_LANGUAGE_STREAK:
+            return streak[0]
+        
+        language = self.detect_language(cleaned_text)
+        if language is not None:
+            count = streak[1] + 1 if streak is not None and streak[0] == language else 1
+            self._language_streaks.put(session_id, (language, count))
+        return language
+    
+    def _check_language_streak(self, session_id: Optional[str], sentiment_result: Dict[str, Any]) -> None:
+        """
+        Reset a session's sticky language when Comprehend was unsure of the sentiment.
+        
+        Args:
+            session_id: Optional session identifier
+            sentiment_result: Comprehend sentiment analysis result
+        """
+        if session_id and max(sentiment_result['SentimentScore'].values()) < _STICKY_LANGUAGE_MIN_CONFIDENCE:
+            self._language_streaks.pop(session_id)
+    
+    def _detect_language_and_sentiment(self, cleaned_text: str, text: str,
+                                       session_id: Optional[str] = None) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Detect the input language and analyze the sentiment of a text in it.
+        
+        Args:
+            cleaned_text: Preprocessed input text, used for language detection
+            text: Text to analyze for sentiment
+            session_id: Optional session identifier, for sticky language detection
+            
+        Returns:
+            Tuple of (detected language, sentiment result)
+        """
+        language = self._detect_session_language(cleaned_text, session_id)
+        sentiment_result = self.analyze_sentiment(text, language or 'en')
+        self._check_language_streak(session_id, sentiment_result)
+        return language, sentiment_result
+    
+    def _speculative_rephrase_and_classify(self, cleaned_text: str, enhanced_text: str,
+                                           session_id: Optional[str] = None) -> Tuple[str, Optional[str], Dict[str, Any]]:
+        """
+        Like _rephrase_and_classify, but without waiting on ChatGPT before Comprehend.
+        
+        Comprehend analyzes the unrephrased text while the rephrase is in flight.
+        The rephrase is used only if it arrives within rephrase_grace_seconds
+        after that and differs materially from the input; a slower rephrase
+        still completes in the background and fills the rephrase cache.
+        
+        Args:
+            cleaned_text: Preprocessed input text
+            enhanced_text: Input text with conversation context
+            session_id: Optional session identifier, for sticky language detection
+            
+        Returns:
+            Tuple of (text sent to Comprehend, detected language, sentiment result)
+        """
+        rephrase_future = _IO_EXECUTOR.submit(self.rephrase_with_chatgpt, enhanced_text)
+        language, sentiment_result = self._detect_language_and_sentiment(cleaned_text, enhanced_text, session_id)
+        
+        try:
+            rephrased_text = rephrase_future.result(timeout=self.rephrase_grace_seconds)
+        except FutureTimeoutError:
+            return enhanced_text, language, sentiment_result
+        
+        similarity = difflib.SequenceMatcher(None, enhanced_text, rephrased_text).ratio()
+        if similarity >= _REPHRASE_SIMILARITY_THRESHOLD:
+            return enhanced_text, language, sentiment_result
+        return rephrased_text, language, self.analyze_sentiment(rephrased_text, language or 'en')
+    
+    def process_text_stream(self, text: str, session_id: Optional[str] = None,
+                            context: Optional[str] = None,
+                            conversation_history: Optional[List[Dict]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Run the pipeline like process_text, streaming the ChatGPT response as it arrives.
+        
+        Events are dicts with a 'type' key:
+        - 'analysis': 'result' holds the analysis without 'adaptive_response'
+        - 'delta': 'content' holds the next chunk of the response text
+        - 'done': 'result' holds the complete analysis, as process_text returns it
+        - 'error': 'result' holds the error, as process_text returns it
+        
+        Args:
+            text: Input text to analyze
+            session_id: Optional session identifier
+            context: Optional context for personalized responses
+            conversation_history: Previous conversation context for better responses
+            
+        Yields:
+            Analysis, response chunk and completion events in order
+        """
+        cleaned_text = self.preprocess_text(text)
+        if not cleaned_text:
+            yield {'type': 'error', 'result': {
+                'error': 'Empty or invalid input text',
+                'timestamp': _utc_timestamp()
+            }}
+            return
+        
+        cache_key = _result_cache_key(cleaned_text, conversation_history)
+        result = self._get_cached_result(cache_key, text, cleaned_text, session_id)
+        if result is None and self.comprehend_breaker.is_open:
+            result = self._degraded_result(text, cleaned_text, session_id)
+        if result is not None:
+            # Nothing to stream: the response is already complete
+            analysis = {key: value for key, value in result.items() if key != 'adaptive_response'}
+            yield {'type': 'analysis', 'result': analysis}
+            yield {'type': 'delta', 'content': result['adaptive_response']}
+            yield {'type': 'done', 'result': result}
+            return
+        
+        enhanced_text = self._enhance_text_with_context(cleaned_text, conversation_history)
+        rephrased_text, language, sentiment_result = self._rephrase_and_classify(
+            cleaned_text, enhanced_text, session_id
+        )
+        emotion_data = self._build_emotion_data(cleaned_text, sentiment_result, conversation_history)
+        analysis = self._build_result(text, cleaned_text, rephrased_text, language,
+                                      sentiment_result, emotion_data, None, session_id)
+        del analysis['adaptive_response']
+        yield {'type': 'analysis', 'result': dict(analysis)}
+        
+        chunks = []
+        for chunk in self.stream_conversational_response_with_chatgpt(emotion_data, text, conversation_history):
+            chunks.append(chunk)
+            yield {'type': 'delta', 'content': chunk}
+        
+        analysis['adaptive_response'] = ''.join(chunks).strip()
+        if not analysis.get('degraded'):
+            self._result_cache.put(cache_key, EmotionResult.from_dict(analysis))
+        yield {'type': 'done', 'result': analysis}
+    
+    def process_text_batch(self, texts: List[str], session_id: Optional[str] = None,
+                           session_ids: Optional[List[Optional[str]]] = None) -> List[Dict[str, Any]]:
+        """
+        Run the emotion detection pipeline over several independent texts.
+        
+        Language detection and sentiment analysis use Comprehend's batch APIs
+        (up to 25 documents per request) instead of one request per text, and
+        the ChatGPT calls for different texts run concurrently.
+        
+        Args:
+            texts: Input texts to analyze
+            session_id: Optional session identifier applied to every result
+            session_ids: Optional per-text session identifiers, overriding session_id
+            
+        Returns:
+            Analysis result for each text, in input order
+        """
+        if session_ids is None:
+            session_ids = [session_id] * len(texts)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        pending = []  # (index, cache_key, cleaned_text)
+        # Repeats of a pending input are analyzed once: (index, first index, cleaned_text)
+        first_index_by_key: Dict[bytes, int] = {}
+        duplicates = []
+        
+        for index, text in enumerate(texts):
+            cleaned_text = self.preprocess_text(text)
+            if not cleaned_text:
+                results[index] = {
+                    'error': 'Empty or invalid input text',
+                    'timestamp': _utc_timestamp()
+                }
+                continue
+            cache_key = _result_cache_key(cleaned_text)
+            if cache_key in first_index_by_key:
+                duplicates.append((index, first_index_by_key[cache_key], cleaned_text))
+                continue
+            results[index] = self._get_cached_result(cache_key, text, cleaned_text, session_ids[index])
+            if results[index] is None:
+                pending.append((index, cache_key, cleaned_text))
+                first_index_by_key[cache_key] = index
+        
+        if not pending:
+            return results
+        
+        cleaned_texts = [cleaned_text for _, _, cleaned_text in pending]
+        if self.batch_rephrase:
+            # One ChatGPT call for every text that needs rephrasing, overlapped with language detection
+            to_rephrase = [position for position, cleaned_text in enumerate(cleaned_texts)
+                           if _needs_rephrase(cleaned_text)]
+            batch_future = _IO_EXECUTOR.submit(self.rephrase_batch_with_chatgpt,
+                                               [cleaned_texts[position] for position in to_rephrase])
+            languages = self.detect_language_batch(cleaned_texts)
+            rephrased_texts = list(cleaned_texts)
+            for position, rephrased_text in zip(to_rephrase, batch_future.result()):
+                rephrased_texts[position] = rephrased_text
+        else:
+            rephrase_futures = [_IO_EXECUTOR.submit(self.rephrase_with_chatgpt, cleaned_text)
+                                if _needs_rephrase(cleaned_text) else None
+                                for cleaned_text in cleaned_texts]
+            languages = self.detect_language_batch(cleaned_texts)
+            rephrased_texts = [future.result() if future is not None else cleaned_text
+                               for future, cleaned_text in zip(rephrase_futures, cleaned_texts)]
+        
+        # Comprehend takes one language per batch, so group texts by language
+        by_language: Dict[str, List[int]] = {}
+        for position, language in enumerate(languages):
+            by_language.setdefault(language or 'en', []).append(position)
+        sentiment_results: List[Optional[Dict[str, Any]]] = [None] * len(pending)
+        for language_code, positions in by_language.items():
+            batch = self.analyze_sentiment_batch([rephrased_texts[p] for p in positions], language_code)
+            for position, sentiment_result in zip(positions, batch):
+                sentiment_results[position] = sentiment_result
+        
+        futures = [
+            _IO_EXECUTOR.submit(self._complete_analysis, texts[index], cleaned_text,
+                                rephrased_texts[position], languages[position],
+                                sentiment_results[position], session_ids[index])
+            for position, (index, _, cleaned_text) in enumerate(pending)
+        ]
+        for (index, cache_key, _), future in zip(pending, futures):
+            results[index] = future.result()
+            if not results[index].get('degraded'):
+                self._result_cache.put(cache_key, EmotionResult.from_dict(results[index]))
+        
+        for index, first_index, cleaned_text in duplicates:
+            results[index] = self._serve_cached_result(EmotionResult.from_dict(results[first_index]),
+                                                       texts[index], cleaned_text, session_ids[index])
+        
+        return results
+    
+    def _get_cached_result(self, cache_key: bytes, text: str, cleaned_text: str,
+                           session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Look up a previously computed analysis for this input.
+        
+        Args:
+            cache_key: Key from _result_cache_key
+            text: Original input text for this call
+            cleaned_text: Preprocessed input text for this call
+            session_id: Session identifier for this call
+            
+        Returns:
+            Copy of the cached analysis updated for this call, or None on a miss
+        """
+        cached_result = self._result_cache.get(cache_key)
+        if cached_result is None:
+            return None
+        return self._serve_cached_result(cached_result, text, cleaned_text, session_id)
+    
+    def _serve_cached_result(self, cached_result: EmotionResult, text: str, cleaned_text: str,
+                             session_id: Optional[str]) -> Dict[str, Any]:
+        """
+        Turn a cached analysis into the result for this call.
+        
+        Args:
+            cached_result: Analysis from the result or semantic cache
+            text: Original input text for this call
+            cleaned_text: Preprocessed input text for this call
+            session_id: Session identifier for this call
+            
+        Returns:
+            Copy of the cached analysis updated for this call
+        """
+        result = cached_result.to_dict()
+        result.update({
+            'input_text': cleaned_text,
+            'original_text': text,
+            'session_id': session_id,
+            'timestamp': _utc_timestamp(),
+            'cached': True
+        })
+        logger.info("Served text analysis from cache: %s -> %s", result['sentiment'], result['emotion'])
+        return result
+    
+    def _complete_analysis(self, text: str, cleaned_text: str, rephrased_text: Optional[str],
+                           language: Optional[str], sentiment_result: Dict[str, Any],
+                           session_id: Optional[str] = None,
+                           conversation_history: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """
+        Turn a Comprehend sentiment result into the final analysis and response.
+        
+        Args:
+            text: Original input text
+            cleaned_text: Preprocessed input text
+            rephrased_text: Rephrased input, or None to produce it together with the response
+            language: Detected language code
+            sentiment_result: Comprehend sentiment analysis result
+            session_id: Optional session identifier
+            conversation_history: Previous conversation context for better responses
+            
+        Returns:
+            Complete analysis results with emotion, sentiment, and response
+        """
+        emotion_data = self._build_emotion_data(cleaned_text, sentiment_result, conversation_history)
+        
+        # Generate conversational response with ChatGPT (now with full conversation history and trends)
+        if rephrased_text is None:
+            rephrased_text, response = self.rephrase_and_respond_with_chatgpt(emotion_data, text, conversation_history)
+        else:
+            response = self.generate_conversational_response_with_chatgpt(emotion_data, text, conversation_history)
+        
+        return self._build_result(text, cleaned_text, rephrased_text, language,
+                                  sentiment_result, emotion_data, response, session_id)
+    
+    def _build_emotion_data(self, cleaned_text: str, sentiment_result: Dict[str, Any],
+                            conversation_history: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """
+        Map a Comprehend sentiment result to emotion data adjusted for feedback and conversation trends.
+        
+        Args:
+            cleaned_text: Preprocessed input text
+            sentiment_result: Comprehend sentiment analysis result
+            conversation_history: Previous conversation context
+            
+        Returns:
+            Emotion data used to generate the response
+        """
         sentiment = sentiment_result['Sentiment']
         scores = sentiment_result['SentimentScore']
         
@@ -881,8 +2415,29 @@ Generate a natural, conversational response that is emotionally appropriate for
                 elif emotional_trends['trend'] == 'Declining Emotional State':
                     emotion_data['valence'] = max(-1.0, emotion_data['valence'] - 0.1)
         
-        # Generate conversational response with ChatGPT (now with full conversation history and trends)
-        response = self.generate_conversational_response_with_chatgpt(emotion_data, text, conversation_history)
+        return emotion_data
+    
+    def _build_result(self, text: str, cleaned_text: str, rephrased_text: str,
+                      language: Optional[str], sentiment_result: Dict[str, Any],
+                      emotion_data: Dict[str, Any], response: Optional[str],
+                      session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Compile the analysis result returned to callers.
+        
+        Args:
+            text: Original input text
+            cleaned_text: Preprocessed input text
+            rephrased_text: Text that was sent to Comprehend
+            language: Detected language code
+            sentiment_result: Comprehend sentiment analysis result
+            emotion_data: Emotion data from _build_emotion_data
+            response: Conversational response
+            session_id: Optional session identifier
+            
+        Returns:
+            Complete analysis results with emotion, sentiment, and response
+        """
+        sentiment = sentiment_result['Sentiment']
         
         # Compile results
         result = {
@@ -891,26 +2446,126 @@ Generate a natural, conversational response that is emotionally appropriate for
             'original_text': text,
             'language': language,
             'sentiment': sentiment,
-            'sentiment_scores': scores,
+            'sentiment_scores': sentiment_result['SentimentScore'],
             'emotion': emotion_data['emotion'],
             'valence': emotion_data['valence'],
             'arousal': emotion_data['arousal'],
             'confidence': emotion_data['confidence'],
             'adaptive_response': response,
             'session_id': session_id,
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': _utc_timestamp()
         }
+        if sentiment_result.get('Degraded'):
+            result['degraded'] = True
         
-        logger.info(f"Processed text analysis: {sentiment} -> {emotion_data['emotion']} (confidence: {emotion_data['confidence']})")
+        logger.info("Processed text analysis: %s -> %s (confidence: %s)", sentiment, emotion_data['emotion'], emotion_data['confidence'])
+        
+        return result
+    
+    def _degraded_result(self, text: str, cleaned_text: str,
+                         session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build a template-only analysis used while the Comprehend circuit is open.
         
+        Args:
+            text: Original input text
+            cleaned_text: Preprocessed input text
+            session_id: Optional session identifier
+            
+        Returns:
+            Neutral analysis result flagged as degraded
+        """
+        sentiment_result = self._neutral_sentiment()
+        emotion_data = self.map_sentiment_to_emotion(sentiment_result['Sentiment'],
+                                                     sentiment_result['SentimentScore'])
+        logger.warning("Comprehend circuit open, returning template response")
+        result = {
+            'input_text': cleaned_text,
+            'rephrased_text': cleaned_text,
+            'original_text': text,
+            'language': None,
+            'sentiment': sentiment_result['Sentiment'],
+            'sentiment_scores': sentiment_result['SentimentScore'],
+            'emotion': emotion_data['emotion'],
+            'valence': emotion_data['valence'],
+            'arousal': emotion_data['arousal'],
+            'confidence': emotion_data['confidence'],
+            'adaptive_response': self.generate_adaptive_response(emotion_data),
+            'session_id': session_id,
+            'timestamp': _utc_timestamp(),
+            'degraded': True
+        }
         return result
     
-    def get_emotional_trends(self, session_data: list) -> Dict[str, Any]:
+    async def aprocess_text(self, text: str, session_id: Optional[str] = None,
+                            context: Optional[str] = None,
+                            conversation_history: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """
+        Async entry point for process_text, for use from ASGI handlers.
+        
+        The boto3 and OpenAI clients are blocking, so the pipeline runs in a
+        worker thread and the event loop stays free to serve other requests.
+        
+        Args:
+            text: Input text to analyze
+            session_id: Optional session identifier
+            context: Optional context for personalized responses
+            conversation_history: Previous conversation context for better responses
+            
+        Returns:
+            Complete analysis results with emotion, sentiment, and response
+        """
+        return await asyncio.to_thread(
+            self.process_text, text, session_id, context, conversation_history
+        )
+    
+    async def aprocess_text_stream(self, text: str, session_id: Optional[str] = None,
+                                   context: Optional[str] = None,
+                                   conversation_history: Optional[List[Dict]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Async entry point for process_text_stream, for use from ASGI handlers.
+        
+        Each event is pulled from the blocking generator in a worker thread, so
+        the event loop can flush earlier chunks while the next one is generated.
+        
+        Args:
+            text: Input text to analyze
+            session_id: Optional session identifier
+            context: Optional context for personalized responses
+            conversation_history: Previous conversation context for better responses
+            
+        Yields:
+            Events as produced by process_text_stream
+        """
+        events = self.process_text_stream(text, session_id, context, conversation_history)
+        done = object()
+        while True:
+            event = await asyncio.to_thread(next, events, done)
+            if event is done:
+                return
+            yield event
+    
+    async def aprocess_text_batch(self, texts: List[str],
+                                  session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Async entry point for process_text_batch, for use from ASGI handlers.
+        
+        Args:
+            texts: Input texts to analyze
+            session_id: Optional session identifier applied to every result
+            
+        Returns:
+            Analysis result for each text, in input order
+        """
+        return await asyncio.to_thread(self.process_text_batch, texts, session_id)
+    
+    def get_emotional_trends(self, session_data: Union[list, SessionBuffer]) -> Dict[str, Any]:
         """
         Analyze emotional trends from session data.
         
         Args:
-            session_data: List of previous analysis results
+            session_data: List of previous analysis results, newest first, or a
+                SessionBuffer of them in the order they were appended (oldest first)
             
         Returns:
             Trend analysis with emotional patterns
@@ -918,12 +2573,53 @@ Generate a natural, conversational response that is emotionally appropriate for
         if not session_data:
             return {'trend': 'No data available'}
         
-        valences = [item.get('valence', 0) for item in session_data]
-        confidences = [item.get('confidence', 0) for item in session_data]
+        if isinstance(session_data, SessionBuffer):
+            # Columns are already contiguous arrays, oldest first
+            valences = session_data.valence[:session_data.size]
+            confidences = session_data.confidence[:session_data.size]
+            avg_valence = float(valences.mean())
+            avg_confidence = float(confidences.mean())
+        else:
+            # One pass over the dicts fills an (n, 2) array of (valence, confidence);
+            # both averages then come from a single column-wise reduction
+            samples = np.fromiter(
+                ((item.get('valence', 0), item.get('confidence', 0)) for item in session_data),
+                dtype=(np.float64, 2),
+                count=len(session_data)
+            )
+            avg_valence, avg_confidence = samples.mean(axis=0).tolist()
+        
+        return self._summarize_trend(avg_valence, avg_confidence, len(session_data))
+    
+    def get_trends_from_totals(self, sum_valence: float, sum_confidence: float, count: int) -> Dict[str, Any]:
+        """
+        Build the emotional trends for a session from its running totals.
         
-        avg_valence = sum(valences) / len(valences)
-        avg_confidence = sum(confidences) / len(confidences)
+        Args:
+            sum_valence: Sum of valence over the session's analyses
+            sum_confidence: Sum of confidence over the session's analyses
+            count: Number of analyses summed
+            
+        Returns:
+            Trend analysis with emotional patterns, as from get_emotional_trends
+        """
+        if not count:
+            return {'trend': 'No data available'}
+        return self._summarize_trend(sum_valence / count, sum_confidence / count, count)
+    
+    @staticmethod
+    def _summarize_trend(avg_valence: float, avg_confidence: float, count: int) -> Dict[str, Any]:
+        """
+        Build the trend analysis returned by get_emotional_trends.
         
+        Args:
+            avg_valence: Average valence over the analyses
+            avg_confidence: Average confidence over the analyses
+            count: Number of analyses averaged
+            
+        Returns:
+            Trend analysis with emotional patterns
+        """
         # Determine trend
         if avg_valence > 0.3:
             trend = 'Positive emotional trend'
@@ -936,5 +2632,5 @@ Generate a natural, conversational response that is emotionally appropriate for
             'trend': trend,
             'average_valence': round(avg_valence, 2),
             'average_confidence': round(avg_confidence, 2),
-            'total_analyses': len(session_data)
+            'total_analyses': count
         }
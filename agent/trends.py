@@ -0,0 +1,122 @@
+"""
+Running emotional-trend statistics kept per session by the State Agent.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+@dataclass(slots=True)
+class SessionBuffer:
+    """
+    Struct-of-arrays store of a session's valence and confidence values.
+
+    Each field lives in its own contiguous float64 array, grown by doubling,
+    so get_emotional_trends averages them without touching result dicts.
+    """
+
+    valence: np.ndarray = field(default_factory=lambda: np.empty(64, dtype=np.float64))
+    confidence: np.ndarray = field(default_factory=lambda: np.empty(64, dtype=np.float64))
+    size: int = 0
+
+    @classmethod
+    def from_results(cls, results: Iterable[Dict[str, Any]]) -> "SessionBuffer":
+        """
+        Build a buffer from analysis result dicts.
+
+        Args:
+            results: Analysis results with valence and confidence
+
+        Returns:
+            Buffer holding the results' values in the same order
+        """
+        buffer = cls()
+        for result in results:
+            buffer.append(result)
+        return buffer
+
+    def append(self, result: Dict[str, Any]) -> None:
+        """
+        Add an analysis result, doubling capacity when full.
+
+        Args:
+            result: Analysis result with valence and confidence
+        """
+        if self.size == self.valence.shape[0]:
+            capacity = self.size * 2
+            self.valence = np.resize(self.valence, capacity)
+            self.confidence = np.resize(self.confidence, capacity)
+        self.valence[self.size] = result.get('valence', 0)
+        self.confidence[self.size] = result.get('confidence', 0)
+        self.size += 1
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class ConversationStats:
+    """
+    Prefix sums of the emotion-tagged exchanges in a conversation history.
+
+    Clients resend the whole history every turn. The stats remember how much
+    of it they have already consumed, so each turn only adds the new
+    exchanges, and any range average (whole history or either half) is O(1).
+    The pattern analysis built from them is kept in ``patterns`` until new
+    exchanges arrive.
+    """
+
+    __slots__ = ('consumed', 'last_exchange', 'valence_prefix', 'arousal_prefix', 'confidence_prefix',
+                 'patterns')
+
+    def __init__(self):
+        self.consumed = 0
+        self.last_exchange: Optional[Dict[str, Any]] = None
+        self.valence_prefix: List[float] = [0.0]
+        self.arousal_prefix: List[float] = [0.0]
+        self.confidence_prefix: List[float] = [0.0]
+        self.patterns: Optional[Dict[str, Any]] = None
+
+    def continues(self, history: List[Dict[str, Any]]) -> bool:
+        """
+        Whether history extends the history these stats were built from.
+
+        Args:
+            history: Conversation history sent with the current turn
+        """
+        return (self.consumed > 0 and len(history) >= self.consumed
+                and history[self.consumed - 1] == self.last_exchange)
+
+    def extend(self, history: List[Dict[str, Any]]) -> None:
+        """
+        Add the exchanges of history not yet consumed.
+
+        Args:
+            history: Conversation history that continues the consumed one
+        """
+        for exchange in history[self.consumed:]:
+            if 'emotion' in exchange and 'valence' in exchange and 'arousal' in exchange:
+                self.patterns = None
+                self.valence_prefix.append(self.valence_prefix[-1] + exchange['valence'])
+                self.arousal_prefix.append(self.arousal_prefix[-1] + exchange['arousal'])
+                self.confidence_prefix.append(self.confidence_prefix[-1] + exchange.get('confidence', 0.5))
+        self.consumed = len(history)
+        self.last_exchange = history[-1] if history else None
+
+    @property
+    def count(self) -> int:
+        """Number of emotion-tagged exchanges consumed."""
+        return len(self.valence_prefix) - 1
+
+    @staticmethod
+    def mean(prefix: List[float], start: int, stop: int) -> float:
+        """
+        Average of the values in [start, stop) from one of the prefix lists.
+
+        Args:
+            prefix: valence_prefix, arousal_prefix or confidence_prefix
+            start: Index of the first exchange in the range
+            stop: Index one past the last exchange in the range
+        """
+        return (prefix[stop] - prefix[start]) / (stop - start)
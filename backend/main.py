@@ -4,14 +4,20 @@ FastAPI backend for emotion detection web app.
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List, Optional
+import asyncio
 import logging
+import os
+import orjson
 import uuid
 from datetime import datetime
 
+from agent.batching import BatchedStateAgent
 from agent.state_agent import StateAgent
 from services.database_service import DatabaseService
+from services.write_queue import AnalysisWriteQueue
 from models.database import create_tables
 
 # Configure logging
@@ -22,7 +28,9 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Emotion Detection API",
     description="API for emotion detection using Amazon Comprehend and intelligent agent",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson serializes large /history and /trends payloads several times faster
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware with proper security configuration
@@ -41,16 +49,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class StreamingAwareGZipMiddleware(GZipMiddleware):
+    """Gzip responses except Server-Sent Event streams, which must reach the client unbuffered."""
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Compress larger JSON responses such as /history and /sessions
+app.add_middleware(StreamingAwareGZipMiddleware, minimum_size=512)
+
 # Initialize State Agent and Database Service
 state_agent = StateAgent()
 db_service = DatabaseService()
 
+# Optionally coalesce concurrent history-free /analyze requests into Comprehend batches
+if os.getenv('REQUEST_BATCHING', 'false').lower() == 'true':
+    text_analyzer = BatchedStateAgent(state_agent)
+else:
+    text_analyzer = state_agent
+
+# Optionally store analyses from a background queue instead of in the request path
+if os.getenv('BACKGROUND_DB_WRITES', 'false').lower() == 'true':
+    write_queue = AnalysisWriteQueue(db_service)
+else:
+    write_queue = None
+
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database tables on startup."""
     create_tables()
     logger.info("Database tables created successfully")
+    if write_queue is not None:
+        write_queue.start()
+    if os.getenv('PREWARM_CONNECTIONS', 'false').lower() == 'true':
+        # Handshake with OpenAI and Comprehend before serving, so first requests skip it
+        await asyncio.to_thread(state_agent.prewarm_connections)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued analyses and persist the agent's caches so the next process starts warm."""
+    if write_queue is not None:
+        await write_queue.close()
+    state_agent.save_semantic_cache()
+    state_agent.save_result_cache()
 
 
 @app.get("/")
@@ -61,8 +108,10 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "analyze": "/analyze",
+            "analyze_stream": "/analyze/stream",
             "history": "/history/{session_id}",
             "trends": "/trends/{session_id}",
+            "session_bundle": "/session_bundle/{session_id}",
             "health": "/health"
         }
     }
@@ -74,6 +123,66 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
 
+async def _parse_analyze_request(request: Request):
+    """
+    Read and validate an analyze request body.
+    
+    Args:
+        request: Incoming request with a JSON body
+        
+    Returns:
+        Tuple of (text, session_id, context, conversation_history); a session
+        ID is generated if the client did not send one
+    """
+    # Parse request data with error handling
+    try:
+        data = await request.json()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="Invalid JSON in request body")
+    
+    text = data.get("text", "").strip()
+    session_id = data.get("session_id")
+    context = data.get("context")
+    conversation_history = data.get("conversation_history", [])
+    
+    # Validate input
+    if not text:
+        raise HTTPException(status_code=400, detail="Text input is required")
+    
+    if len(text) > 5000:  # Reasonable limit for text input
+        raise HTTPException(status_code=400, detail="Text input too long (max 5000 characters)")
+    
+    # Generate session ID if not provided
+    if not session_id:
+        session_id = str(uuid.uuid4())
+    
+    return text, session_id, context, conversation_history
+
+
+async def _store_analysis(result: dict, session_id: str) -> Optional[str]:
+    """
+    Store a completed analysis, in the background when the write queue is enabled.
+    
+    Args:
+        result: Analysis result from the State Agent
+        session_id: Session the analysis belongs to
+        
+    Returns:
+        ID of the stored analysis, or None if it is queued or could not be saved
+    """
+    if write_queue is not None:
+        # Stored in the background, so no row ID exists yet
+        await write_queue.put(result)
+        return None
+    try:
+        # The transaction blocks, so it runs in a worker thread like the agent call
+        return await asyncio.to_thread(db_service.record_emotion_analysis, result, session_id, 1)  # Increment by 1
+    except Exception as e:
+        logger.error("Database save error: %s", e)
+        # Continue without failing - analysis still works
+        return None
+
+
 @app.post("/analyze")
 async def analyze_emotion(request: Request):
     """
@@ -86,46 +195,20 @@ async def analyze_emotion(request: Request):
     - conversation_history: array (optional) - Previous conversation context
     """
     try:
-        # Parse request data with error handling
-        try:
-            data = await request.json()
-        except Exception as e:
-            raise HTTPException(status_code=400, detail="Invalid JSON in request body")
-        
-        text = data.get("text", "").strip()
-        session_id = data.get("session_id")
-        context = data.get("context")
-        conversation_history = data.get("conversation_history", [])
-        
-        # Validate input
-        if not text:
-            raise HTTPException(status_code=400, detail="Text input is required")
-        
-        if len(text) > 5000:  # Reasonable limit for text input
-            raise HTTPException(status_code=400, detail="Text input too long (max 5000 characters)")
-        
-        # Generate session ID if not provided
-        if not session_id:
-            session_id = str(uuid.uuid4())
+        text, session_id, context, conversation_history = await _parse_analyze_request(request)
         
         # Process text through State Agent with conversation history
         try:
-            result = state_agent.process_text(text, session_id, context, conversation_history)
+            result = await text_analyzer.aprocess_text(text, session_id, context, conversation_history)
         except Exception as e:
-            logger.error(f"State Agent processing error: {str(e)}")
+            logger.error("State Agent processing error: %s", e)
             raise HTTPException(status_code=500, detail="Error processing emotion analysis")
         
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
         
         # Store analysis in database with error handling
-        try:
-            analysis_id = db_service.save_emotion_analysis(result)
-            db_service.update_session(session_id, 1)  # Increment by 1
-        except Exception as e:
-            logger.error(f"Database save error: {str(e)}")
-            # Continue without failing - analysis still works
-            analysis_id = None
+        analysis_id = await _store_analysis(result, session_id)
         
         # Return analysis result
         return {
@@ -138,21 +221,67 @@ async def analyze_emotion(request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in analyze_emotion: {str(e)}")
+        logger.error("Unexpected error in analyze_emotion: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.post("/analyze/stream")
+async def analyze_emotion_stream(request: Request):
+    """
+    Analyze emotion like /analyze, streaming the response as Server-Sent Events.
+    
+    The request body is the same as /analyze. Events, in order:
+    - analysis: the emotion analysis, without the response
+    - delta: the next chunk of the response text
+    - done: the complete analysis with session_id and analysis_id
+    - error: processing failed; no further events follow
+    """
+    text, session_id, context, conversation_history = await _parse_analyze_request(request)
+    
+    def sse(event: str, data: dict) -> bytes:
+        return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+    
+    async def events():
+        try:
+            async for event in state_agent.aprocess_text_stream(text, session_id, context, conversation_history):
+                if event['type'] == 'analysis':
+                    yield sse('analysis', {"analysis": event['result'], "session_id": session_id})
+                elif event['type'] == 'delta':
+                    yield sse('delta', {"content": event['content']})
+                elif event['type'] == 'done':
+                    analysis_id = await _store_analysis(event['result'], session_id)
+                    yield sse('done', {
+                        "success": True,
+                        "analysis": event['result'],
+                        "session_id": session_id,
+                        "analysis_id": analysis_id
+                    })
+                else:
+                    yield sse('error', {"detail": event['result']['error']})
+        except Exception as e:
+            logger.error("State Agent streaming error: %s", e)
+            yield sse('error', {"detail": "Error processing emotion analysis"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.get("/history/{session_id}")
-async def get_session_history(session_id: str, limit: int = 50):
+async def get_session_history(session_id: str, limit: int = 50, fields: Optional[str] = None):
     """
     Get analysis history for a specific session.
     
     Args:
         session_id: Session identifier
         limit: Maximum number of results to return
+        fields: Optional comma-separated columns to return, e.g. "valence,arousal,timestamp"
     """
     try:
-        analyses = db_service.get_session_history(session_id, limit)
+        field_list = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        try:
+            analyses = db_service.get_session_history(session_id, limit, field_list)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         return {
             "session_id": session_id,
@@ -160,11 +289,38 @@ async def get_session_history(session_id: str, limit: int = 50):
             "history": analyses
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error getting session history: {str(e)}")
+        logger.error("Error getting session history: %s", e)
         raise HTTPException(status_code=500, detail=f"Error retrieving history: {str(e)}")
 
 
+def _session_trends(session_id: str) -> dict:
+    """
+    Compute a session's emotional trends from its running totals in the database.
+    
+    The totals cover every analysis stored for the session, and are the same
+    whichever worker answers, so /trends and /session_bundle always agree.
+    Analyses still waiting in the background write queue are not yet counted.
+    Sessions stored before the totals existed, and not yet backfilled, fall
+    back to a scan of their latest 1000 analyses.
+    
+    Args:
+        session_id: Session identifier
+        
+    Returns:
+        Trend analysis from the State Agent
+    """
+    stats = db_service.get_session_stats(session_id)
+    if stats is not None:
+        return state_agent.get_trends_from_totals(stats['sum_valence'], stats['sum_confidence'], stats['count'])
+    
+    # Get the session's analyses for trend analysis
+    analyses = db_service.get_session_history(session_id, 1000, ['valence', 'confidence'])
+    return state_agent.get_emotional_trends(analyses)
+
+
 @app.get("/trends/{session_id}")
 async def get_emotional_trends(session_id: str):
     """
@@ -174,23 +330,51 @@ async def get_emotional_trends(session_id: str):
         session_id: Session identifier
     """
     try:
-        # Get all analyses for the session
-        analyses = db_service.get_session_history(session_id, 1000)  # Get more for trend analysis
-        
-        # Get trends from State Agent
-        trends = state_agent.get_emotional_trends(analyses)
+        trends = _session_trends(session_id)
         
         return {
             "session_id": session_id,
             "trends": trends,
-            "total_analyses": len(analyses)
+            "total_analyses": trends.get('total_analyses', 0)
         }
         
     except Exception as e:
-        logger.error(f"Error getting emotional trends: {str(e)}")
+        logger.error("Error getting emotional trends: %s", e)
         raise HTTPException(status_code=500, detail=f"Error retrieving trends: {str(e)}")
 
 
+@app.get("/session_bundle/{session_id}")
+async def get_session_bundle(session_id: str, limit: int = 50, fields: Optional[str] = None):
+    """
+    Get a session's history and emotional trends in one response.
+    
+    Args:
+        session_id: Session identifier
+        limit: Maximum number of history results to return
+        fields: Optional comma-separated history columns to return, as for /history
+    """
+    try:
+        field_list = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        try:
+            analyses = db_service.get_session_history(session_id, limit, field_list)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        trends = _session_trends(session_id)
+        
+        return {
+            "session_id": session_id,
+            "history": analyses,
+            "trends": trends,
+            "total_analyses": trends.get('total_analyses', 0)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting session bundle: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error retrieving session: {str(e)}")
+
+
 @app.get("/sessions")
 async def get_all_sessions(limit: int = 20):
     """
@@ -208,7 +392,7 @@ async def get_all_sessions(limit: int = 20):
         }
         
     except Exception as e:
-        logger.error(f"Error getting sessions: {str(e)}")
+        logger.error("Error getting sessions: %s", e)
         raise HTTPException(status_code=500, detail=f"Error retrieving sessions: {str(e)}")
 
 
@@ -227,7 +411,7 @@ async def delete_session(session_id: str):
         return {"message": f"Session {session_id} and all analyses deleted successfully"}
         
     except Exception as e:
-        logger.error(f"Error deleting session: {str(e)}")
+        logger.error("Error deleting session: %s", e)
         raise HTTPException(status_code=500, detail=f"Error deleting session: {str(e)}")
 
 
@@ -3,12 +3,14 @@ Database models and configuration for emotion detection app.
 Supports AWS RDS (PostgreSQL) and DynamoDB.
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, JSON
+from sqlalchemy import create_engine, inspect, text, Column, Index, Integer, String, Float, DateTime, Text, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+from decimal import Decimal
 import os
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
@@ -20,16 +22,30 @@ USE_DYNAMODB = os.getenv('USE_DYNAMODB', 'false').lower() == 'true'
 
 # Create engine for SQL databases with proper connection pool settings
 if not USE_DYNAMODB:
-    engine = create_engine(
-        DATABASE_URL,
-        # Removed pool_size, max_overflow, pool_timeout for SQLite compatibility
-        pool_recycle=3600,      # Recycle connections after 1 hour
-        pool_pre_ping=True     # Validate connections before use
-    )
+    is_sqlite = DATABASE_URL.startswith('sqlite')
+    engine_options = {
+        'pool_recycle': 3600,   # Recycle connections after 1 hour
+        # Validate connections before use; a local SQLite file has no connection to lose
+        'pool_pre_ping': os.getenv('DB_PRE_PING', 'false' if is_sqlite else 'true').lower() == 'true'
+    }
+    if not is_sqlite:
+        # Size the pool to the worker threads that check connections out concurrently
+        engine_options['pool_size'] = int(os.getenv('DB_POOL_SIZE', str((os.cpu_count() or 2) * 2)))
+        engine_options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    engine = create_engine(DATABASE_URL, **engine_options)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 else:
-    # DynamoDB configuration
-    dynamodb = boto3.resource('dynamodb', region_name=os.getenv('AWS_DEFAULT_REGION', 'us-east-1'))
+    # DynamoDB configuration: one resource per process with a larger keepalive
+    # pool and adaptive retries for throttled writes
+    dynamodb = boto3.resource(
+        'dynamodb',
+        region_name=os.getenv('AWS_DEFAULT_REGION', 'us-east-1'),
+        config=Config(
+            retries={'max_attempts': 10, 'mode': 'adaptive'},
+            max_pool_connections=25,
+            tcp_keepalive=True
+        )
+    )
     engine = None
     SessionLocal = None
 
@@ -42,7 +58,7 @@ class EmotionAnalysis(Base):
     __tablename__ = "emotion_analyses"
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, index=True)
+    session_id = Column(String)
     input_text = Column(Text)
     original_text = Column(Text)
     language = Column(String)
@@ -55,6 +71,11 @@ class EmotionAnalysis(Base):
     adaptive_response = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
     
+    # Serves session lookups and their newest-first history as one ordered index scan
+    __table_args__ = (
+        Index('ix_emotion_session_ts', session_id, timestamp.desc()),
+    )
+    
     def to_dict(self):
         """Convert model to dictionary."""
         return {
@@ -85,6 +106,10 @@ class UserSession(Base):
     last_activity = Column(DateTime, default=datetime.utcnow)
     total_analyses = Column(Integer, default=0)
     emotional_trend = Column(String)
+    # Running totals over the session's analyses, so trends need no history scan
+    sum_valence = Column(Float, default=0.0)
+    sum_confidence = Column(Float, default=0.0)
+    analysis_count = Column(Integer, default=0)
     
     def to_dict(self):
         """Convert model to dictionary."""
@@ -114,8 +139,36 @@ def create_tables():
     """Create all database tables."""
     if USE_DYNAMODB:
         create_dynamodb_tables()
+        backfill_dynamodb_session_stats()
     else:
         Base.metadata.create_all(bind=engine)
+        add_session_stats_columns()
+        # create_all skips indexes on tables that already exist
+        for index in EmotionAnalysis.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def add_session_stats_columns():
+    """
+    Add the running-total columns to a user_sessions table created before
+    them, backfilled from the analyses already stored.
+    """
+    existing = {column['name'] for column in inspect(engine).get_columns('user_sessions')}
+    if 'analysis_count' in existing:
+        return
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE user_sessions ADD COLUMN sum_valence FLOAT DEFAULT 0"))
+        connection.execute(text("ALTER TABLE user_sessions ADD COLUMN sum_confidence FLOAT DEFAULT 0"))
+        connection.execute(text("ALTER TABLE user_sessions ADD COLUMN analysis_count INTEGER DEFAULT 0"))
+        connection.execute(text("""
+            UPDATE user_sessions SET
+                sum_valence = (SELECT COALESCE(SUM(valence), 0) FROM emotion_analyses
+                               WHERE emotion_analyses.session_id = user_sessions.session_id),
+                sum_confidence = (SELECT COALESCE(SUM(confidence), 0) FROM emotion_analyses
+                                  WHERE emotion_analyses.session_id = user_sessions.session_id),
+                analysis_count = (SELECT COUNT(*) FROM emotion_analyses
+                                  WHERE emotion_analyses.session_id = user_sessions.session_id)
+        """))
 
 
 def create_dynamodb_tables():
@@ -186,6 +239,62 @@ def create_dynamodb_tables():
             print(f"❌ Error creating DynamoDB tables: {e}")
 
 
+def backfill_dynamodb_session_stats():
+    """
+    Give user_sessions items written before the running totals existed their
+    totals, summed from the analyses already stored for each session.
+    """
+    sessions_table = dynamodb.Table('user_sessions')
+    analyses_table = dynamodb.Table('emotion_analyses')
+    scan = {
+        'FilterExpression': 'attribute_not_exists(analysis_count)',
+        'ProjectionExpression': 'session_id'
+    }
+    backfilled = 0
+    while True:
+        page = sessions_table.scan(**scan)
+        for session in page.get('Items', []):
+            session_id = session['session_id']
+            sum_valence = sum_confidence = Decimal(0)
+            count = 0
+            query = {
+                'IndexName': 'session-index',
+                'KeyConditionExpression': 'session_id = :session_id',
+                'ExpressionAttributeValues': {':session_id': session_id},
+                'ProjectionExpression': 'valence, confidence'
+            }
+            while True:
+                response = analyses_table.query(**query)
+                for item in response.get('Items', []):
+                    sum_valence += Decimal(str(item.get('valence', 0)))
+                    sum_confidence += Decimal(str(item.get('confidence', 0)))
+                    count += 1
+                if 'LastEvaluatedKey' not in response:
+                    break
+                query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            try:
+                # Skip sessions that picked up totals of their own since the scan
+                sessions_table.update_item(
+                    Key={'session_id': session_id},
+                    UpdateExpression="SET sum_valence = :valence, sum_confidence = :confidence, analysis_count = :count",
+                    ConditionExpression='attribute_not_exists(analysis_count)',
+                    ExpressionAttributeValues={
+                        ':valence': sum_valence,
+                        ':confidence': sum_confidence,
+                        ':count': count
+                    }
+                )
+                backfilled += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        if 'LastEvaluatedKey' not in page:
+            break
+        scan['ExclusiveStartKey'] = page['LastEvaluatedKey']
+    if backfilled:
+        print(f"✅ Backfilled running totals for {backfilled} DynamoDB sessions")
+
+
 def get_dynamodb_table(table_name):
     """Get DynamoDB table resource."""
     if USE_DYNAMODB:
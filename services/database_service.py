@@ -3,15 +3,58 @@ Database service for handling both SQL and DynamoDB operations.
 Provides a unified interface for database operations.
 """
 
+import operator
 import uuid
+from collections import defaultdict
 from datetime import datetime
+from decimal import Decimal
 from typing import List, Dict, Any, Optional
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from models.database import (
     EmotionAnalysis, UserSession, get_db, get_dynamodb_table, 
     USE_DYNAMODB
 )
 
+# Analysis result keys stored as emotion_analyses columns
+ANALYSIS_FIELDS = (
+    'session_id', 'input_text', 'original_text', 'language', 'sentiment',
+    'sentiment_scores', 'emotion', 'valence', 'arousal', 'confidence',
+    'adaptive_response'
+)
+_get_analysis_fields = operator.itemgetter(*ANALYSIS_FIELDS)
+
+
+def _analysis_columns(analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pick the stored columns out of an analysis result.
+    
+    Complete results are read with one C-level itemgetter call; results
+    missing a key fall back to per-field lookups that default to None.
+    """
+    try:
+        values = _get_analysis_fields(analysis_data)
+    except KeyError:
+        values = [analysis_data.get(field) for field in ANALYSIS_FIELDS]
+    return dict(zip(ANALYSIS_FIELDS, values))
+
+
+# Columns get_session_history can be limited to
+HISTORY_FIELDS = ('id',) + ANALYSIS_FIELDS + ('timestamp',)
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE, for single-statement session upserts
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+# Columns returned by get_all_sessions, as in UserSession.to_dict
+SESSION_FIELDS = ('id', 'session_id', 'created_at', 'last_activity', 'total_analyses', 'emotional_trend')
+
+
+def _row_to_dict(row) -> Dict[str, Any]:
+    """Convert a Core result row to a dict, with datetimes as ISO strings."""
+    return {
+        column: value.isoformat() if isinstance(value, datetime) else value
+        for column, value in row._mapping.items()
+    }
+
 
 class DatabaseService:
     """Unified database service for SQL and DynamoDB operations."""
@@ -33,78 +76,214 @@ class DatabaseService:
         """Save emotion analysis to DynamoDB."""
         analysis_id = str(uuid.uuid4())
         
-        item = {
-            'id': analysis_id,
-            'session_id': analysis_data.get('session_id'),
-            'input_text': analysis_data.get('input_text'),
-            'original_text': analysis_data.get('original_text'),
-            'language': analysis_data.get('language'),
-            'sentiment': analysis_data.get('sentiment'),
-            'sentiment_scores': analysis_data.get('sentiment_scores'),
-            'emotion': analysis_data.get('emotion'),
-            'valence': analysis_data.get('valence'),
-            'arousal': analysis_data.get('arousal'),
-            'confidence': analysis_data.get('confidence'),
-            'adaptive_response': analysis_data.get('adaptive_response'),
-            'timestamp': datetime.utcnow().isoformat()
-        }
+        item = _analysis_columns(analysis_data)
+        item['id'] = analysis_id
+        item['timestamp'] = datetime.utcnow().isoformat()
         
         self.emotion_table.put_item(Item=item)
+        self._add_session_stats_dynamodb([analysis_data])
         return analysis_id
     
     def _save_emotion_analysis_sql(self, analysis_data: Dict[str, Any]) -> str:
         """Save emotion analysis to SQL database."""
         db = next(get_db())
         try:
-            analysis = EmotionAnalysis(
-                session_id=analysis_data.get('session_id'),
-                input_text=analysis_data.get('input_text'),
-                original_text=analysis_data.get('original_text'),
-                language=analysis_data.get('language'),
-                sentiment=analysis_data.get('sentiment'),
-                sentiment_scores=analysis_data.get('sentiment_scores'),
-                emotion=analysis_data.get('emotion'),
-                valence=analysis_data.get('valence'),
-                arousal=analysis_data.get('arousal'),
-                confidence=analysis_data.get('confidence'),
-                adaptive_response=analysis_data.get('adaptive_response')
-            )
-            
-            db.add(analysis)
+            analysis_id = self._insert_emotion_analysis_sql(db, analysis_data)
+            self._add_session_stats_sql(db, [analysis_data])
             db.commit()
-            db.refresh(analysis)
-            return str(analysis.id)
+            return str(analysis_id)
         finally:
             db.close()
     
-    def get_session_history(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get analysis history for a session."""
+    def _insert_emotion_analysis_sql(self, db: Session, analysis_data: Dict[str, Any]) -> int:
+        """Insert an analysis with a Core INSERT, returning its new ID without an ORM refresh."""
+        result = db.execute(insert(EmotionAnalysis.__table__).values(**_analysis_columns(analysis_data)))
+        return result.inserted_primary_key[0]
+    
+    def record_emotion_analysis(self, analysis_data: Dict[str, Any], session_id: str,
+                                total_analyses: int = None) -> str:
+        """Save emotion analysis and update its session, in one SQL session and transaction."""
         if self.use_dynamodb:
-            return self._get_session_history_dynamodb(session_id, limit)
+            analysis_id = self._save_emotion_analysis_dynamodb(analysis_data)
+            self._update_session_dynamodb(session_id, total_analyses)
+            return analysis_id
+        
+        db = next(get_db())
+        try:
+            self._touch_session_sql(db, session_id, total_analyses)
+            # The session row must exist before the running totals are added to it
+            db.flush()
+            analysis_id = self._insert_emotion_analysis_sql(db, analysis_data)
+            self._add_session_stats_sql(db, [analysis_data])
+            db.commit()
+            return str(analysis_id)
+        finally:
+            db.close()
+    
+    def save_emotion_analyses(self, analyses: List[Dict[str, Any]]):
+        """Save a batch of emotion analyses in one bulk write."""
+        if self.use_dynamodb:
+            self._save_emotion_analyses_dynamodb(analyses)
         else:
-            return self._get_session_history_sql(session_id, limit)
+            self._save_emotion_analyses_sql(analyses)
+    
+    def _save_emotion_analyses_dynamodb(self, analyses: List[Dict[str, Any]]):
+        """Save emotion analyses to DynamoDB with a batch writer."""
+        timestamp = datetime.utcnow().isoformat()
+        with self.emotion_table.batch_writer() as batch:
+            for analysis_data in analyses:
+                item = _analysis_columns(analysis_data)
+                item['id'] = str(uuid.uuid4())
+                item['timestamp'] = timestamp
+                batch.put_item(Item=item)
+        self._add_session_stats_dynamodb(analyses)
     
-    def _get_session_history_dynamodb(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+    def _save_emotion_analyses_sql(self, analyses: List[Dict[str, Any]]):
+        """Save emotion analyses to SQL database with a single executemany insert."""
+        db = next(get_db())
+        try:
+            timestamp = datetime.utcnow()
+            db.bulk_insert_mappings(EmotionAnalysis, [
+                {**_analysis_columns(analysis_data), 'timestamp': timestamp}
+                for analysis_data in analyses
+            ])
+            self._add_session_stats_sql(db, analyses)
+            db.commit()
+        finally:
+            db.close()
+    
+    @staticmethod
+    def _session_stats(analyses: List[Dict[str, Any]]) -> Dict[str, List[float]]:
+        """Sum valence, confidence and count per session over a list of analyses."""
+        stats = defaultdict(lambda: [0.0, 0.0, 0])
+        for analysis_data in analyses:
+            session_id = analysis_data.get('session_id')
+            if session_id:
+                totals = stats[session_id]
+                totals[0] += analysis_data.get('valence') or 0.0
+                totals[1] += analysis_data.get('confidence') or 0.0
+                totals[2] += 1
+        return stats
+    
+    def _add_session_stats_sql(self, db: Session, analyses: List[Dict[str, Any]]):
+        """Add analyses to their sessions' running totals within the caller's transaction."""
+        dialect = db.get_bind().dialect.name
+        for session_id, (valence, confidence, count) in self._session_stats(analyses).items():
+            if dialect in _UPSERT_INSERTS:
+                # ON CONFLICT so concurrent writers creating the same session both succeed
+                now = datetime.utcnow()
+                table = UserSession.__table__
+                stmt = _UPSERT_INSERTS[dialect](table).values(
+                    session_id=session_id,
+                    created_at=now,
+                    last_activity=now,
+                    total_analyses=1,
+                    sum_valence=valence,
+                    sum_confidence=confidence,
+                    analysis_count=count
+                )
+                db.execute(stmt.on_conflict_do_update(index_elements=['session_id'], set_={
+                    'sum_valence': table.c.sum_valence + stmt.excluded.sum_valence,
+                    'sum_confidence': table.c.sum_confidence + stmt.excluded.sum_confidence,
+                    'analysis_count': table.c.analysis_count + stmt.excluded.analysis_count
+                }))
+                continue
+            updated = db.query(UserSession).filter(UserSession.session_id == session_id).update({
+                UserSession.sum_valence: UserSession.sum_valence + valence,
+                UserSession.sum_confidence: UserSession.sum_confidence + confidence,
+                UserSession.analysis_count: UserSession.analysis_count + count
+            }, synchronize_session=False)
+            if not updated:
+                db.add(UserSession(
+                    session_id=session_id,
+                    total_analyses=1,
+                    sum_valence=valence,
+                    sum_confidence=confidence,
+                    analysis_count=count
+                ))
+    
+    def _add_session_stats_dynamodb(self, analyses: List[Dict[str, Any]]):
+        """Add analyses to their sessions' running totals with atomic ADD updates."""
+        for session_id, (valence, confidence, count) in self._session_stats(analyses).items():
+            self.sessions_table.update_item(
+                Key={'session_id': session_id},
+                UpdateExpression="ADD sum_valence :valence, sum_confidence :confidence, analysis_count :count",
+                ExpressionAttributeValues={
+                    ':valence': Decimal(str(valence)),
+                    ':confidence': Decimal(str(confidence)),
+                    ':count': count
+                }
+            )
+    
+    def get_session_stats(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a session's running valence and confidence totals, or None if it has no analyses."""
+        if self.use_dynamodb:
+            item = self.sessions_table.get_item(Key={'session_id': session_id}).get('Item')
+            if not item or not item.get('analysis_count'):
+                return None
+            return {
+                'sum_valence': float(item['sum_valence']),
+                'sum_confidence': float(item['sum_confidence']),
+                'count': int(item['analysis_count'])
+            }
+        
+        db = next(get_db())
+        try:
+            session = db.query(UserSession).filter(UserSession.session_id == session_id).first()
+            if not session or not session.analysis_count:
+                return None
+            return {
+                'sum_valence': session.sum_valence or 0.0,
+                'sum_confidence': session.sum_confidence or 0.0,
+                'count': session.analysis_count
+            }
+        finally:
+            db.close()
+    
+    def get_session_history(self, session_id: str, limit: int = 50,
+                            fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Get analysis history for a session, optionally only the given HISTORY_FIELDS."""
+        if fields:
+            unknown = set(fields) - set(HISTORY_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown history fields: {', '.join(sorted(unknown))}")
+        if self.use_dynamodb:
+            return self._get_session_history_dynamodb(session_id, limit, fields)
+        else:
+            return self._get_session_history_sql(session_id, limit, fields)
+    
+    def _get_session_history_dynamodb(self, session_id: str, limit: int,
+                                      fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """Get session history from DynamoDB."""
-        response = self.emotion_table.query(
-            IndexName='session-index',
-            KeyConditionExpression='session_id = :session_id',
-            ExpressionAttributeValues={':session_id': session_id},
-            ScanIndexForward=False,  # Sort by timestamp descending
-            Limit=limit
-        )
+        query = {
+            'IndexName': 'session-index',
+            'KeyConditionExpression': 'session_id = :session_id',
+            'ExpressionAttributeValues': {':session_id': session_id},
+            'ScanIndexForward': False,  # Sort by timestamp descending
+            'Limit': limit
+        }
+        if fields:
+            # Attribute name placeholders, since e.g. timestamp is a reserved word
+            query['ProjectionExpression'] = ', '.join(f'#{field}' for field in fields)
+            query['ExpressionAttributeNames'] = {f'#{field}': field for field in fields}
+        response = self.emotion_table.query(**query)
         
         return [item for item in response.get('Items', [])]
     
-    def _get_session_history_sql(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+    def _get_session_history_sql(self, session_id: str, limit: int,
+                                 fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """Get session history from SQL database."""
         db = next(get_db())
         try:
-            analyses = db.query(EmotionAnalysis).filter(
-                EmotionAnalysis.session_id == session_id
-            ).order_by(EmotionAnalysis.timestamp.desc()).limit(limit).all()
-            
-            return [analysis.to_dict() for analysis in analyses]
+            # Core select of plain columns: rows become dicts without building ORM instances
+            columns = [EmotionAnalysis.__table__.c[field] for field in (fields or HISTORY_FIELDS)]
+            rows = db.execute(
+                select(*columns)
+                .where(EmotionAnalysis.session_id == session_id)
+                .order_by(EmotionAnalysis.timestamp.desc())
+                .limit(limit)
+            ).all()
+            return [_row_to_dict(row) for row in rows]
         finally:
             db.close()
     
@@ -116,34 +295,27 @@ class DatabaseService:
             self._update_session_sql(session_id, total_analyses)
     
     def _update_session_dynamodb(self, session_id: str, total_analyses: int = None):
-        """Update session in DynamoDB."""
+        """Update or create session in DynamoDB with a single update_item."""
         try:
-            # Try to get existing session
-            response = self.sessions_table.get_item(Key={'session_id': session_id})
-            
-            if 'Item' in response:
-                # Update existing session
-                update_expression = "SET last_activity = :timestamp"
-                expression_values = {':timestamp': datetime.utcnow().isoformat()}
-                
-                if total_analyses is not None:
-                    update_expression += ", total_analyses = :total"
-                    expression_values[':total'] = total_analyses
-                
-                self.sessions_table.update_item(
-                    Key={'session_id': session_id},
-                    UpdateExpression=update_expression,
-                    ExpressionAttributeValues=expression_values
-                )
+            timestamp = datetime.utcnow().isoformat()
+            # if_not_exists fills the creation fields only when the item is new
+            update_expression = ("SET last_activity = :timestamp, "
+                                 "created_at = if_not_exists(created_at, :timestamp), "
+                                 "emotional_trend = if_not_exists(emotional_trend, :none), "
+                                 "total_analyses = ")
+            expression_values = {':timestamp': timestamp, ':none': None}
+            if total_analyses is not None:
+                update_expression += ":total"
+                expression_values[':total'] = total_analyses
             else:
-                # Create new session
-                self.sessions_table.put_item(Item={
-                    'session_id': session_id,
-                    'created_at': datetime.utcnow().isoformat(),
-                    'last_activity': datetime.utcnow().isoformat(),
-                    'total_analyses': total_analyses or 1,
-                    'emotional_trend': None
-                })
+                update_expression += "if_not_exists(total_analyses, :one)"
+                expression_values[':one'] = 1
+            
+            self.sessions_table.update_item(
+                Key={'session_id': session_id},
+                UpdateExpression=update_expression,
+                ExpressionAttributeValues=expression_values
+            )
         except Exception as e:
             print(f"Error updating session in DynamoDB: {e}")
     
@@ -151,23 +323,42 @@ class DatabaseService:
         """Update session in SQL database."""
         db = next(get_db())
         try:
-            session = db.query(UserSession).filter(UserSession.session_id == session_id).first()
-            
-            if session:
-                session.last_activity = datetime.utcnow()
-                if total_analyses is not None:
-                    session.total_analyses = total_analyses
-            else:
-                session = UserSession(
-                    session_id=session_id,
-                    total_analyses=total_analyses or 1
-                )
-                db.add(session)
-            
+            self._touch_session_sql(db, session_id, total_analyses)
             db.commit()
         finally:
             db.close()
     
+    def _touch_session_sql(self, db: Session, session_id: str, total_analyses: int = None):
+        """Update or create a session within the caller's transaction."""
+        dialect = db.get_bind().dialect.name
+        if dialect in _UPSERT_INSERTS:
+            # One INSERT ... ON CONFLICT DO UPDATE instead of a SELECT then an UPDATE or INSERT
+            now = datetime.utcnow()
+            stmt = _UPSERT_INSERTS[dialect](UserSession.__table__).values(
+                session_id=session_id,
+                created_at=now,
+                last_activity=now,
+                total_analyses=total_analyses or 1
+            )
+            updates = {'last_activity': stmt.excluded.last_activity}
+            if total_analyses is not None:
+                updates['total_analyses'] = stmt.excluded.total_analyses
+            db.execute(stmt.on_conflict_do_update(index_elements=['session_id'], set_=updates))
+            return
+        
+        session = db.query(UserSession).filter(UserSession.session_id == session_id).first()
+        
+        if session:
+            session.last_activity = datetime.utcnow()
+            if total_analyses is not None:
+                session.total_analyses = total_analyses
+        else:
+            session = UserSession(
+                session_id=session_id,
+                total_analyses=total_analyses or 1
+            )
+            db.add(session)
+    
     def get_all_sessions(self, limit: int = 20) -> List[Dict[str, Any]]:
         """Get all user sessions."""
         if self.use_dynamodb:
@@ -184,11 +375,11 @@ class DatabaseService:
         """Get all sessions from SQL database."""
         db = next(get_db())
         try:
-            sessions = db.query(UserSession).order_by(
-                UserSession.last_activity.desc()
-            ).limit(limit).all()
-            
-            return [session.to_dict() for session in sessions]
+            columns = [UserSession.__table__.c[field] for field in SESSION_FIELDS]
+            rows = db.execute(
+                select(*columns).order_by(UserSession.last_activity.desc()).limit(limit)
+            ).all()
+            return [_row_to_dict(row) for row in rows]
         finally:
             db.close()
     
@@ -201,15 +392,22 @@ class DatabaseService:
     
     def _delete_session_dynamodb(self, session_id: str):
         """Delete session from DynamoDB."""
-        # Delete all analyses for the session
-        response = self.emotion_table.query(
-            IndexName='session-index',
-            KeyConditionExpression='session_id = :session_id',
-            ExpressionAttributeValues={':session_id': session_id}
-        )
-        
-        for item in response.get('Items', []):
-            self.emotion_table.delete_item(Key={'id': item['id']})
+        # Delete all analyses for the session, following every page of the
+        # query and sending the deletes in 25-item batches
+        query = {
+            'IndexName': 'session-index',
+            'KeyConditionExpression': 'session_id = :session_id',
+            'ExpressionAttributeValues': {':session_id': session_id},
+            'ProjectionExpression': 'id'
+        }
+        with self.emotion_table.batch_writer() as batch:
+            while True:
+                response = self.emotion_table.query(**query)
+                for item in response.get('Items', []):
+                    batch.delete_item(Key={'id': item['id']})
+                if 'LastEvaluatedKey' not in response:
+                    break
+                query['ExclusiveStartKey'] = response['LastEvaluatedKey']
         
         # Delete the session
         self.sessions_table.delete_item(Key={'session_id': session_id})
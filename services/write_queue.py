@@ -0,0 +1,119 @@
+"""
+Background writer that takes analysis persistence off the /analyze
+request path and stores results in batches.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from services.database_service import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisWriteQueue:
+    """
+    Async queue of analysis results flushed to the database in batches.
+
+    A batch is written when it reaches max_batch_size results or max_wait
+    seconds after its first result was queued, whichever comes first. Writes
+    run in a worker thread so the event loop keeps serving requests. A
+    failed batch write is retried before the batch is dropped.
+    """
+
+    def __init__(self, db_service: DatabaseService, max_batch_size: int = 32, max_wait: float = 0.2,
+                 max_attempts: int = 2, retry_delay: float = 0.5):
+        """
+        Initialize the writer.
+
+        Args:
+            db_service: Database service that stores the batches
+            max_batch_size: Maximum results per bulk insert
+            max_wait: Seconds to wait for more results after the first one arrives
+            max_attempts: Times a batch write is tried before the batch is dropped
+            retry_delay: Seconds to wait before retrying a failed batch write
+        """
+        self.db_service = db_service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the background writer task on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.get_running_loop().create_task(self._run())
+
+    async def put(self, result: Dict[str, Any]) -> None:
+        """
+        Queue an analysis result for storage.
+
+        Args:
+            result: Analysis result as returned by the State Agent
+        """
+        await self._queue.put(result)
+
+    async def close(self) -> None:
+        """Flush everything still queued and stop the writer."""
+        if self._writer is None:
+            return
+        await self._queue.put(None)
+        await self._writer
+        self._writer = None
+
+    async def _run(self) -> None:
+        """Gather queued results into batches and write each one until close() is called."""
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            result = await self._queue.get()
+            if result is None:
+                break
+            batch = [result]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    result = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if result is None:
+                    closing = True
+                    break
+                batch.append(result)
+            await asyncio.to_thread(self._flush, batch)
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        """
+        Store one batch, retrying a failed write, and touch each of its sessions once.
+
+        Args:
+            batch: Analysis results to store
+        """
+        session_ids = [session_id for session_id in dict.fromkeys(result.get('session_id') for result in batch)
+                       if session_id]
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                # The bulk write is one transaction, so a failed attempt stored nothing
+                self.db_service.save_emotion_analyses(batch)
+                break
+            except Exception as e:
+                if attempt < self.max_attempts:
+                    logger.warning("Database batch save error (%d analyses), retrying: %s", len(batch), e)
+                    time.sleep(self.retry_delay)
+                else:
+                    # Continue without failing - the analyses were already returned
+                    logger.error("Dropped %d analyses for sessions %s after %d attempts: %s",
+                                 len(batch), ', '.join(session_ids), attempt, e)
+                    return
+        for session_id in session_ids:
+            try:
+                self.db_service.update_session(session_id, 1)
+            except Exception as e:
+                logger.error("Database session update error for %s: %s", session_id, e)
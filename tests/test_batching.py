@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+from agent.batching import BatchedStateAgent
+
+
+class FakeAgent:
+    """Stands in for StateAgent, recording the size of every batch it is given."""
+
+    def __init__(self, drop_last=0):
+        self.batch_sizes = []
+        self.drop_last = drop_last
+        self._lock = threading.Lock()
+
+    def process_text_batch(self, texts, session_ids=None):
+        with self._lock:
+            self.batch_sizes.append(len(texts))
+        results = [{'input_text': text, 'session_id': session_id}
+                   for text, session_id in zip(texts, session_ids)]
+        return results[:len(results) - self.drop_last]
+
+
+def test_concurrent_calls_are_split_at_max_batch_size():
+    agent = FakeAgent()
+
+    async def run():
+        batcher = BatchedStateAgent(agent, max_batch_size=25, max_wait=0.05)
+        return await asyncio.gather(*(batcher.aprocess_text(f"text {i}", f"s{i}") for i in range(60)))
+
+    results = asyncio.run(run())
+
+    assert sorted(agent.batch_sizes) == [10, 25, 25]
+    assert [result['input_text'] for result in results] == [f"text {i}" for i in range(60)]
+    assert [result['session_id'] for result in results] == [f"s{i}" for i in range(60)]
+
+
+def test_short_batch_result_fails_unmatched_callers():
+    agent = FakeAgent(drop_last=2)
+
+    async def run():
+        batcher = BatchedStateAgent(agent, max_batch_size=5, max_wait=0.05)
+        calls = [batcher.aprocess_text(f"text {i}") for i in range(5)]
+        return await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), timeout=5)
+
+    results = asyncio.run(run())
+
+    assert [result['input_text'] for result in results[:3]] == ["text 0", "text 1", "text 2"]
+    assert all(isinstance(result, RuntimeError) for result in results[3:])
+
+
+def test_batch_failure_reaches_every_caller():
+    class FailingAgent(FakeAgent):
+        def process_text_batch(self, texts, session_ids=None):
+            raise ValueError("comprehend down")
+
+    async def run():
+        batcher = BatchedStateAgent(FailingAgent(), max_batch_size=5, max_wait=0.05)
+        calls = [batcher.aprocess_text(f"text {i}") for i in range(3)]
+        return await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), timeout=5)
+
+    results = asyncio.run(run())
+
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
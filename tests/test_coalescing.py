@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from agent.coalescing import SentimentCoalescer
+
+
+class FakeBatchAnalyzer:
+    """Scores each text as itself, recording the size of every batch it is given."""
+
+    def __init__(self, drop_last=0):
+        self.batch_sizes = []
+        self.drop_last = drop_last
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, language_code):
+        with self._lock:
+            self.batch_sizes.append(len(texts))
+        results = [{'Sentiment': 'NEUTRAL', 'Text': text, 'LanguageCode': language_code} for text in texts]
+        return results[:len(results) - self.drop_last]
+
+
+def run_concurrently(coalescer, texts, language_code='en'):
+    """Call analyze from one thread per text, returning each call's result or exception."""
+    outcomes = [None] * len(texts)
+    barrier = threading.Barrier(len(texts))
+
+    def call(index):
+        barrier.wait()
+        try:
+            outcomes[index] = coalescer.analyze(texts[index], language_code)
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads)
+    return outcomes
+
+
+def test_concurrent_callers_each_get_their_own_result():
+    analyzer = FakeBatchAnalyzer()
+    coalescer = SentimentCoalescer(analyzer, max_batch_size=25, max_wait=0.05)
+    texts = [f"text {i}" for i in range(60)]
+
+    outcomes = run_concurrently(coalescer, texts)
+
+    assert [outcome['Text'] for outcome in outcomes] == texts
+    assert sum(analyzer.batch_sizes) == 60
+    assert max(analyzer.batch_sizes) <= 25
+    assert len(analyzer.batch_sizes) < 60
+
+
+def test_languages_are_batched_separately():
+    analyzer = FakeBatchAnalyzer()
+    coalescer = SentimentCoalescer(analyzer, max_batch_size=25, max_wait=0.05)
+
+    english = run_concurrently(coalescer, ['hello'])
+    spanish = run_concurrently(coalescer, ['hola'], 'es')
+
+    assert english[0]['LanguageCode'] == 'en'
+    assert spanish[0]['LanguageCode'] == 'es'
+
+
+def test_batch_failure_reaches_every_waiter():
+    def failing_batch(texts, language_code):
+        raise ValueError("comprehend down")
+
+    coalescer = SentimentCoalescer(failing_batch, max_batch_size=25, max_wait=0.05)
+
+    outcomes = run_concurrently(coalescer, [f"text {i}" for i in range(30)])
+
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+
+def test_short_batch_result_fails_unmatched_waiters():
+    coalescer = SentimentCoalescer(FakeBatchAnalyzer(drop_last=1), max_batch_size=3, max_wait=1)
+
+    outcomes = run_concurrently(coalescer, ['a', 'b', 'c'])
+
+    assert sum(isinstance(outcome, RuntimeError) for outcome in outcomes) == 1
+    assert sorted(outcome['Text'] for outcome in outcomes if isinstance(outcome, dict)) in (
+        ['a', 'b'], ['a', 'c'], ['b', 'c'])
+
+
+def test_single_call_is_analyzed_after_max_wait():
+    coalescer = SentimentCoalescer(FakeBatchAnalyzer(), max_batch_size=25, max_wait=0.01)
+
+    assert coalescer.analyze('alone', 'en')['Text'] == 'alone'
+
+
+def test_single_call_failure_is_raised():
+    def failing_batch(texts, language_code):
+        raise ValueError("comprehend down")
+
+    coalescer = SentimentCoalescer(failing_batch, max_wait=0.01)
+
+    with pytest.raises(ValueError):
+        coalescer.analyze('alone', 'en')
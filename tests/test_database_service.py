@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models.database as database
+from models.database import Base
+from services.database_service import DatabaseService
+
+
+@pytest.fixture
+def db_service(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'emotion_detection.db'}",
+                           connect_args={'check_same_thread': False, 'timeout': 30})
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(database, 'engine', engine)
+    monkeypatch.setattr(database, 'SessionLocal', sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    yield DatabaseService()
+    engine.dispose()
+
+
+def analysis(valence, confidence):
+    return {'session_id': 'new-session', 'input_text': 'hello', 'emotion': 'calm',
+            'valence': valence, 'confidence': confidence}
+
+
+def test_concurrent_records_on_a_new_session_both_land_in_the_totals(db_service):
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def record(data):
+        barrier.wait()
+        try:
+            db_service.record_emotion_analysis(data, 'new-session', 1)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=record, args=(analysis(0.5, 0.8),)),
+               threading.Thread(target=record, args=(analysis(-0.25, 0.6),))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert errors == []
+    stats = db_service.get_session_stats('new-session')
+    assert stats['count'] == 2
+    assert stats['sum_valence'] == pytest.approx(0.25)
+    assert stats['sum_confidence'] == pytest.approx(1.4)
+
+
+class FakeTable:
+    """Serves scan and query pages of one item each, and applies conditional SET updates."""
+
+    def __init__(self, items):
+        self.items = items
+
+    def scan(self, FilterExpression, ProjectionExpression, ExclusiveStartKey=0):
+        pending = [item for item in self.items if 'analysis_count' not in item]
+        return self._page(pending, ExclusiveStartKey)
+
+    def query(self, IndexName, KeyConditionExpression, ExpressionAttributeValues,
+              ProjectionExpression, ExclusiveStartKey=0):
+        session_id = ExpressionAttributeValues[':session_id']
+        return self._page([item for item in self.items if item['session_id'] == session_id],
+                          ExclusiveStartKey)
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues):
+        item = next(item for item in self.items if item['session_id'] == Key['session_id'])
+        item['sum_valence'] = ExpressionAttributeValues[':valence']
+        item['sum_confidence'] = ExpressionAttributeValues[':confidence']
+        item['analysis_count'] = ExpressionAttributeValues[':count']
+
+    @staticmethod
+    def _page(items, start):
+        page = {'Items': items[start:start + 1]}
+        if start + 1 < len(items):
+            page['LastEvaluatedKey'] = start + 1
+        return page
+
+
+def test_dynamodb_backfill_sums_stored_analyses(monkeypatch):
+    from decimal import Decimal
+
+    sessions = [{'session_id': 'old'},
+                {'session_id': 'current', 'analysis_count': 3,
+                 'sum_valence': Decimal('1'), 'sum_confidence': Decimal('2')}]
+    analyses = [{'session_id': 'old', 'valence': Decimal('0.5'), 'confidence': Decimal('0.9')},
+                {'session_id': 'old', 'valence': Decimal('-0.25'), 'confidence': Decimal('0.5')}]
+    tables = {'user_sessions': FakeTable(sessions), 'emotion_analyses': FakeTable(analyses)}
+
+    class FakeDynamoDB:
+        def Table(self, name):
+            return tables[name]
+
+    monkeypatch.setattr(database, 'dynamodb', FakeDynamoDB(), raising=False)
+
+    database.backfill_dynamodb_session_stats()
+
+    assert sessions[0] == {'session_id': 'old', 'sum_valence': Decimal('0.25'),
+                           'sum_confidence': Decimal('1.4'), 'analysis_count': 2}
+    assert sessions[1]['analysis_count'] == 3
@@ -0,0 +1,98 @@
+import io
+import json
+import tarfile
+
+import pytest
+
+from agent.rescoring import SentimentRescorer
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+
+class FakeComprehend:
+    """Runs the job synchronously: lines containing 'fail' come back as per-document errors."""
+
+    def __init__(self, s3):
+        self.s3 = s3
+        self.job = None
+
+    def start_sentiment_detection_job(self, **job):
+        self.job = job
+        bucket, key = job['InputDataConfig']['S3Uri'][len('s3://'):].split('/', 1)
+        lines = self.s3.objects[(bucket, key)].decode('utf-8').split('\n')
+        records = []
+        for line_number, line in enumerate(lines):
+            if 'fail' in line:
+                records.append({'Line': line_number, 'ErrorCode': 'INTERNAL_SERVER_ERROR',
+                                'ErrorMessage': 'Internal server error'})
+            else:
+                records.append({'Line': line_number, 'Sentiment': 'POSITIVE',
+                                'SentimentScore': {'Positive': 0.9, 'Negative': 0.0,
+                                                   'Neutral': 0.1, 'Mixed': 0.0},
+                                'Text': line})
+        data = '\n'.join(json.dumps(record) for record in records).encode('utf-8')
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            member = tarfile.TarInfo('output')
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+        self.s3.objects[('bucket', 'out/output.tar.gz')] = archive.getvalue()
+        return {'JobId': 'job-1'}
+
+    def describe_sentiment_detection_job(self, JobId):
+        return {'SentimentDetectionJobProperties': {
+            'JobStatus': 'COMPLETED',
+            'InputDataConfig': self.job['InputDataConfig'],
+            'OutputDataConfig': {'S3Uri': 's3://bucket/out/output.tar.gz'}
+        }}
+
+
+@pytest.fixture
+def rescorer():
+    rescorer = SentimentRescorer('bucket', 'rescoring/', 'arn:aws:iam::123456789012:role/comprehend')
+    rescorer.s3 = FakeS3()
+    rescorer.comprehend = FakeComprehend(rescorer.s3)
+    return rescorer
+
+
+def test_results_match_inputs_with_duplicates_blanks_and_errors(rescorer):
+    texts = ['great day', '', 'great day', 'please fail', '   ', 'lovely', 'fail again']
+
+    job_id = rescorer.start(texts)
+    results = rescorer.results(job_id)
+
+    assert len(results) == len(texts)
+    assert [result is not None for result in results] == [True, False, True, False, False, True, False]
+    assert results[0] == results[2] == {
+        'Sentiment': 'POSITIVE',
+        'SentimentScore': {'Positive': 0.9, 'Negative': 0.0, 'Neutral': 0.1, 'Mixed': 0.0}
+    }
+
+
+def test_blank_texts_are_not_sent(rescorer):
+    rescorer.start(['first', '', 'second'])
+
+    bucket, key = rescorer.comprehend.job['InputDataConfig']['S3Uri'][len('s3://'):].split('/', 1)
+    assert rescorer.s3.objects[(bucket, key)] == b'first\nsecond'
+
+
+def test_failure_on_every_document_keeps_one_result_per_text(rescorer):
+    texts = ['fail one', 'fail two', '']
+
+    results = rescorer.results(rescorer.start(texts))
+
+    assert results == [None, None, None]
+
+
+def test_start_rejects_only_blank_texts(rescorer):
+    with pytest.raises(ValueError):
+        rescorer.start(['', '  '])
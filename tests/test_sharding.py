@@ -0,0 +1,75 @@
+import pytest
+
+from agent.state_agent import StateAgent, _COMPREHEND_MAX_BYTES, _shard_comprehend_text
+
+
+def assert_within_limit(shards):
+    assert shards
+    assert all(0 < len(shard.encode('utf-8')) <= _COMPREHEND_MAX_BYTES for shard in shards)
+
+
+@pytest.mark.parametrize('text', [
+    '!' * 6000,
+    '?!.' * 4000,
+    'é' * 3000,
+    '😀' * 2000,
+    '我今天很难过因为工作压力太大了' * 300,
+])
+def test_unspaced_text_is_sharded_without_loss(text):
+    shards = _shard_comprehend_text(text)
+
+    assert_within_limit(shards)
+    assert len(shards) > 1
+    assert ''.join(shards) == text
+
+
+def test_long_words_are_split_without_inserting_spaces():
+    text = 'start ' + 'é' * 4000 + ' middle ' + 'x' * 6000 + ' end'
+
+    shards = _shard_comprehend_text(text)
+
+    assert_within_limit(shards)
+    assert ''.join(shards).replace(' ', '') == text.replace(' ', '')
+    # Fragments of a long word are not padded with spaces of their own
+    assert ''.join(shards).count(' ') <= text.count(' ')
+
+
+class FakeComprehend:
+    def __init__(self):
+        self.documents = []
+
+    def detect_sentiment(self, Text, LanguageCode):
+        self.documents.append(Text)
+        return {'Sentiment': 'NEUTRAL',
+                'SentimentScore': {'Positive': 0.1, 'Negative': 0.1, 'Neutral': 0.7, 'Mixed': 0.1}}
+
+    def batch_detect_sentiment(self, TextList, LanguageCode):
+        results = []
+        for index, text in enumerate(TextList):
+            result = self.detect_sentiment(text, LanguageCode)
+            result['Index'] = index
+            results.append(result)
+        return {'ResultList': results, 'ErrorList': []}
+
+
+@pytest.fixture
+def agent():
+    agent = StateAgent()
+    agent.comprehend = FakeComprehend()
+    return agent
+
+
+@pytest.mark.parametrize('text', ['!' * 6000, 'é' * 3000, '我很难过' * 1000])
+def test_analyze_sentiment_handles_oversized_text_without_words(agent, text):
+    result = agent.analyze_sentiment(text)
+
+    assert result['Sentiment'] == 'NEUTRAL'
+    assert agent.comprehend.documents
+    assert all(len(document.encode('utf-8')) <= _COMPREHEND_MAX_BYTES for document in agent.comprehend.documents)
+
+
+def test_analyze_sentiment_long_without_shards_is_neutral(agent):
+    result = agent.analyze_sentiment_long(' ' * 6000)
+
+    assert result['Sentiment'] == 'NEUTRAL'
+    assert agent.comprehend.documents == []
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import threading
+
+from services.write_queue import AnalysisWriteQueue
+
+
+class FakeDatabaseService:
+    """Records stored batches and touched sessions; the first `failures` saves raise."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+        self.sessions = []
+        self._lock = threading.Lock()
+
+    def save_emotion_analyses(self, analyses):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("database unavailable")
+            self.batches.append([analysis['input_text'] for analysis in analyses])
+
+    def update_session(self, session_id, total_analyses=None):
+        with self._lock:
+            self.sessions.append(session_id)
+
+
+def analysis(index, session_id='s1'):
+    return {'input_text': f"text {index}", 'session_id': session_id}
+
+
+async def wait_for_batches(db, count, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while len(db.batches) < count and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_full_batch_is_flushed_without_waiting_for_timeout():
+    db = FakeDatabaseService()
+
+    async def run():
+        queue = AnalysisWriteQueue(db, max_batch_size=3, max_wait=30)
+        queue.start()
+        for index in range(3):
+            await queue.put(analysis(index))
+        await wait_for_batches(db, 1)
+        batches = list(db.batches)
+        await queue.close()
+        return batches
+
+    assert asyncio.run(run()) == [["text 0", "text 1", "text 2"]]
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    db = FakeDatabaseService()
+
+    async def run():
+        queue = AnalysisWriteQueue(db, max_batch_size=32, max_wait=0.05)
+        queue.start()
+        await queue.put(analysis(0, 'a'))
+        await queue.put(analysis(1, 'b'))
+        await wait_for_batches(db, 1)
+        batches = list(db.batches)
+        await queue.close()
+        return batches
+
+    assert asyncio.run(run()) == [["text 0", "text 1"]]
+    assert db.sessions == ['a', 'b']
+
+
+def test_close_drains_queued_results():
+    db = FakeDatabaseService()
+
+    async def run():
+        queue = AnalysisWriteQueue(db, max_batch_size=4, max_wait=30)
+        queue.start()
+        for index in range(10):
+            await queue.put(analysis(index))
+        await queue.close()
+
+    asyncio.run(run())
+
+    assert [text for batch in db.batches for text in batch] == [f"text {index}" for index in range(10)]
+    assert db.sessions == ['s1'] * len(db.batches)
+
+
+def test_failed_batch_is_retried():
+    db = FakeDatabaseService(failures=1)
+
+    async def run():
+        queue = AnalysisWriteQueue(db, max_batch_size=2, max_wait=30, retry_delay=0)
+        queue.start()
+        await queue.put(analysis(0))
+        await queue.put(analysis(1))
+        await queue.close()
+
+    asyncio.run(run())
+
+    assert db.batches == [["text 0", "text 1"]]
+    assert db.sessions == ['s1']
+
+
+def test_dropped_batch_logs_its_sessions(caplog):
+    db = FakeDatabaseService(failures=2)
+
+    async def run():
+        queue = AnalysisWriteQueue(db, max_batch_size=2, max_wait=30, retry_delay=0)
+        queue.start()
+        await queue.put(analysis(0, 'a'))
+        await queue.put(analysis(1, 'b'))
+        await queue.close()
+
+    with caplog.at_level(logging.ERROR, logger='services.write_queue'):
+        asyncio.run(run())
+
+    assert db.batches == []
+    assert db.sessions == []
+    assert "Dropped 2 analyses for sessions a, b" in caplog.text